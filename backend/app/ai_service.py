@@ -1,71 +1,256 @@
-import os, json, hashlib, re
-from typing import List, Tuple
+import os, math, time, hashlib, asyncio, logging, unicodedata
+from collections import deque
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+from .llm_json import RoadmapStreamParser, RoadmapError, parse_roadmap, ROADMAP_SCHEMA, ROADMAP_GRAMMAR
+from .cache import r, TwoTierCache
+from .singleflight import SingleFlight
+from .llm_queue import GenerationQueue
+from .llm_router import Backend, Router, backends_from_env, LLM_TIMEOUT
+from .metrics import (
+    LLM_REQUESTS, LLM_LATENCY, LLM_TTFT, LLM_TOKENS, LLM_GENERATIONS,
+    LLM_PARSE, LLM_WASTED_TOKENS, LLM_RETRIES as LLM_RETRIES_TOTAL,
+    LLM_EARLY_STOPS, LLM_MAX_TOKENS_GAUGE, LLM_PROMPT_EVAL,
+)
 
-# ---- Redis ----
-try:
-    import redis
-except Exception:
-    redis = None
+log = logging.getLogger(__name__)
 
-REDIS_URL = os.getenv("REDIS_URL")
-r = redis.from_url(REDIS_URL) if (redis and REDIS_URL) else None
+PROVIDER = os.getenv("AI_PROVIDER", "stub")  # oss | openai | stub; серверы — см. llm_router
 
-PROVIDER = os.getenv("AI_PROVIDER", "stub")
-OSS_BASE_URL = os.getenv("OSS_BASE_URL", "http://llm:8080/v1")
-OSS_MODEL = os.getenv("OSS_MODEL", "gpt-oss-20b")
-OSS_API_KEY = os.getenv("OSS_API_KEY", "local")
+# ---- LLM ----
+# json_schema — response_format со схемой; grammar — GBNF (старые сборки llama.cpp); off — без ограничений
+LLM_OUTPUT_MODE = os.getenv("LLM_OUTPUT_MODE", "json_schema")
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "800"))  # потолок; обычный max_tokens — по наблюдаемым ответам
+LLM_MIN_TOKENS = int(os.getenv("LLM_MIN_TOKENS", "200"))
+LLM_TOKENS_HEADROOM = float(os.getenv("LLM_TOKENS_HEADROOM", "1.5"))
+# cache_prompt + id_slot: префикс промпта остаётся в KV-кэше «своего» слота llama.cpp.
+# Если один llama.cpp делят несколько процессов backend — выключите (0), иначе они толкаются в одни слоты.
+LLM_PIN_SLOTS = os.getenv("LLM_PIN_SLOTS", "1") == "1"
+LLM_EARLY_STOP = os.getenv("LLM_EARLY_STOP", "1") == "1"  # закрыть стрим, если после `}` пошёл текст
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "1"))  # повторов, если ответ не собрался в роадмап
+LLM_RETRY_MAX_TOKENS = int(os.getenv("LLM_RETRY_MAX_TOKENS", "400"))
 
-def _cache_get(k: str):
-    if not r: return None
-    v = r.get(k)
-    return json.loads(v) if v else None
+router = Router(backends_from_env()) if PROVIDER != "stub" else None
 
-def _cache_set(k: str, val, ttl=3600):
-    if r: r.setex(k, ttl, json.dumps(val, ensure_ascii=False))
+# все обращения к модели идут через очередь: воркеров столько же, сколько слотов у основных серверов
+queue = GenerationQueue(
+    workers=router.capacity if router else 1,
+    max_depth=int(os.getenv("LLM_QUEUE_MAX", "32")),
+    per_user=int(os.getenv("LLM_QUEUE_PER_USER", "2")),
+    retry_after=int(os.getenv("LLM_QUEUE_RETRY_AFTER", "30")),
+)
 
-def _extract_json(text: str):
-    text = (text or "").strip()
+_cache = TwoTierCache(
+    "roadmap", r,
+    local_size=int(os.getenv("AI_CACHE_LOCAL_SIZE", "1024")),
+    local_ttl=float(os.getenv("AI_CACHE_LOCAL_TTL", "300")),
+    ttl=int(os.getenv("AI_CACHE_TTL", "3600")),
+    negative_ttl=int(os.getenv("AI_CACHE_NEGATIVE_TTL", "60")),
+)
+
+# одна генерация на ключ идеи: дубли (двойной тап, ретрай) ждут результат лидера
+_flight = SingleFlight(
+    r, "roadmap",
+    lease=float(os.getenv("AI_LOCK_LEASE", "30")),
+    wait_timeout=float(os.getenv("AI_LOCK_WAIT", str(LLM_TIMEOUT * 3))),
+)
+
+async def aclose():
+    await queue.aclose()
+    if router is not None:
+        await router.aclose()
+    if r is not None:
+        await r.aclose()
+
+def normalize_idea(idea: str) -> str:
+    """«Telegram bot for X» и «telegram  bot for x » — одна и та же идея."""
+    return " ".join(unicodedata.normalize("NFKC", idea).split()).casefold()
+
+def roadmap_key(idea: str) -> str:
+    return "ai:roadmap:" + hashlib.sha256(normalize_idea(idea).encode()).hexdigest()
+
+# on_event получает события RoadmapStreamParser по мере генерации
+OnEvent = Optional[Callable[[tuple], None]]
+
+# Неизменный префикс: одинаковые байты в начале каждого запроса — llama.cpp берёт их из KV-кэша
+# слота и считает только хвост с идеей. Всё, что зависит от запроса, — только в user-сообщении.
+SYSTEM_PROMPT = (
+    "Ты продакт-менеджер. Коротко опиши идею (1–2 предложения) и дай РОВНО 6 "
+    "конкретных задач MVP. Ответ строго в JSON:\n"
+    '{ "description": "…", "tasks": ["…","…","…","…","…","…"] }\n'
+    "Никакого текста вне JSON."
+)
+
+class TokenBudget:
+    """max_tokens по последним успешным ответам: p99 × headroom в пределах [floor, ceiling]."""
+
+    def __init__(self, ceiling: int, floor: int, headroom: float, window: int = 200, min_samples: int = 20):
+        self.ceiling = ceiling
+        self.floor = min(floor, ceiling)
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self._samples: deque = deque(maxlen=window)
+
+    def observe(self, tokens: int):
+        self._samples.append(tokens)
+
+    def current(self) -> int:
+        if len(self._samples) < self.min_samples:
+            return self.ceiling
+        ordered = sorted(self._samples)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        return max(self.floor, min(self.ceiling, math.ceil(p99 * self.headroom)))
+
+budget = TokenBudget(LLM_MAX_TOKENS, LLM_MIN_TOKENS, LLM_TOKENS_HEADROOM)
+
+def _request_options(backend: Backend, slot: Optional[int]) -> dict:
+    """Ограничение вывода (модель физически не выйдет за схему) и привязка к слоту llama.cpp."""
+    options, extra = {}, {}
+    if backend.kind == "openai":
+        # без расширений llama.cpp; схема с minItems/maxLength в strict-режиме OpenAI не принимается
+        if LLM_OUTPUT_MODE != "off":
+            options["response_format"] = {"type": "json_object"}
+        return options
+    if LLM_OUTPUT_MODE == "json_schema":
+        options["response_format"] = {"type": "json_schema",
+                                      "json_schema": {"name": "roadmap", "schema": ROADMAP_SCHEMA, "strict": True}}
+    elif LLM_OUTPUT_MODE == "grammar":
+        extra["grammar"] = ROADMAP_GRAMMAR
+    if LLM_PIN_SLOTS and slot is not None:
+        extra.update(cache_prompt=True, id_slot=slot)
+    if extra:
+        options["extra_body"] = extra
+    return options
+
+def _prompt_stats(chunk) -> Tuple[Optional[int], Optional[float]]:
+    """(токенов промпта из кэша, секунд на prompt eval) — из usage или timings llama.cpp, если есть."""
+    cached = seconds = None
+    details = getattr(chunk.usage, "prompt_tokens_details", None) if chunk.usage else None
+    if details is not None and getattr(details, "cached_tokens", None) is not None:
+        cached = details.cached_tokens
+    timings = (chunk.model_extra or {}).get("timings")
+    if timings:
+        if cached is None and chunk.usage and "prompt_n" in timings:
+            cached = max(0, chunk.usage.prompt_tokens - timings["prompt_n"])
+        if "prompt_ms" in timings:
+            seconds = timings["prompt_ms"] / 1000
+    return cached, seconds
+
+async def _llm_call(idea: str, max_tokens: int, emit: Callable[[tuple], None],
+                    backend: Backend, slot: Optional[int] = None) -> Tuple[RoadmapStreamParser, int]:
+    """
+    Один потоковый вызов модели на backend. Возвращает парсер с ответом и число токенов ответа.
+    Если после закрывшегося JSON-объекта модель продолжает писать, стрим закрывается:
+    llama.cpp видит обрыв и освобождает слот, не догенерируя хвост. Ответ, который
+    кончается на `}` (json_schema, grammar), дочитывается до чанка с usage и timings.
+    """
+    started = time.monotonic()
+    chunks, usage = 0, None
+    parser = RoadmapStreamParser()
+    stream = None
     try:
-        return json.loads(text)
+        stream = await backend.client.chat.completions.create(
+            model=backend.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f"Идея: {idea}"},
+            ],
+            temperature=0.2,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            **_request_options(backend, slot),
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+                cached, prompt_seconds = _prompt_stats(chunk)
+                if cached is not None:
+                    LLM_TOKENS.labels("prompt_cached").inc(cached)
+                if prompt_seconds is not None:
+                    LLM_PROMPT_EVAL.observe(prompt_seconds)
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            if LLM_EARLY_STOP and parser.json.complete and delta.strip():
+                # после `}` модель пишет дальше — обрываем; пустые чанки (finish_reason, usage) дочитываем
+                LLM_EARLY_STOPS.inc()
+                await stream.close()
+                break
+            if not chunks:
+                LLM_TTFT.observe(time.monotonic() - started)
+            chunks += 1
+            for event in parser.feed(delta):
+                emit(event)
+    except asyncio.CancelledError:
+        # проигравший хедж: закрываем стрим, чтобы сервер бросил генерацию
+        LLM_REQUESTS.labels(backend.name, "cancelled").inc()
+        if stream is not None:
+            await stream.close()
+        raise
     except Exception:
-        pass
-    m = re.search(r"\{.*\}", text, re.DOTALL)
-    if m:
+        LLM_REQUESTS.labels(backend.name, "error").inc()
+        raise
+    finally:
+        LLM_LATENCY.labels(backend.name).observe(time.monotonic() - started)
+        # без usage (старый сервер, ранняя остановка) считаем чанки: llama.cpp шлёт по токену на чанк
+        LLM_TOKENS.labels("completion").inc(usage.completion_tokens if usage else chunks)
+        if usage:
+            LLM_TOKENS.labels("prompt").inc(usage.prompt_tokens)
+    LLM_REQUESTS.labels(backend.name, "ok").inc()
+    return parser, usage.completion_tokens if usage else chunks
+
+async def _llm_generate(idea: str, on_event: OnEvent = None):
+    """
+    Генерация с проверкой ответа: недописанный JSON чинится, а если роадмап всё равно
+    не собрался — не больше LLM_RETRIES повторов с меньшим max_tokens, затем ошибка (→ заглушка).
+    Сервер для каждой попытки выбирает router (failover, хедж).
+    События показывает один вызов за раз; если его ответ отброшен (ошибка сервера,
+    отбракованный JSON), следующий начинает с ("reset",) — частичный результат сбрасывается.
+    """
+    shown = {"by": None, "any": False}  # чей ответ сейчас у пользователя; показывали ли что-то
+
+    def emitter(tag: tuple) -> Callable[[tuple], None]:
+        def emit(event: tuple):
+            if shown["by"] is None:
+                shown["by"] = tag
+                if shown["any"] and on_event:
+                    on_event(("reset",))
+            if shown["by"] != tag:
+                return
+            shown["any"] = True
+            if on_event:
+                on_event(event)
+        return emit
+
+    max_tokens = budget.current()
+    LLM_MAX_TOKENS_GAUGE.set(max_tokens)
+    for attempt in range(LLM_RETRIES + 1):
+        async def call(backend: Backend, slot: Optional[int]):
+            tag = (attempt, backend.name)
+            try:
+                return await _llm_call(idea, max_tokens, emitter(tag), backend, slot)
+            except BaseException:
+                if shown["by"] == tag:
+                    shown["by"] = None  # вызов не доехал — показывать начнёт следующий
+                raise
+
+        parser, tokens = await router.run(call)
         try:
-            return json.loads(m.group(0))
-        except Exception:
-            pass
-    raise ValueError("LLM: не удалось распарсить JSON")
-
-def _oss_generate(idea: str):
-    from openai import OpenAI
-    client = OpenAI(base_url=OSS_BASE_URL, api_key=OSS_API_KEY)
-
-    sys = (
-        "Ты продакт-менеджер. Коротко опиши идею (1–2 предложения) и дай РОВНО 6 "
-        "конкретных задач MVP. Ответ строго в JSON:\n"
-        '{ "description": "…", "tasks": ["…","…","…","…","…","…"] }\n'
-        "Никакого текста вне JSON."
-    )
-    user = f"Идея: {idea}"
-
-    resp = client.chat.completions.create(
-        model=OSS_MODEL,
-        messages=[
-            {"role": "system", "content": sys},
-            {"role": "user", "content": user},
-        ],
-        temperature=0.2,
-        max_tokens=800,
-    )
-    content = resp.choices[0].message.content or ""
-    data = _extract_json(content)
-
-    desc = str(data.get("description", "")).strip()
-    tasks = [str(t).strip() for t in (data.get("tasks") or []) if str(t).strip()]
-    if not desc or not tasks:
-        raise ValueError("LLM: пустой ответ")
-    return desc, tasks[:7]
+            desc, tasks, repaired = parse_roadmap(parser.json)
+        except RoadmapError as e:
+            shown["by"] = None
+            LLM_PARSE.labels(e.reason).inc()
+            LLM_WASTED_TOKENS.inc(tokens)
+            if attempt == LLM_RETRIES:
+                raise
+            LLM_RETRIES_TOTAL.inc()
+            log.warning("roadmap attempt %d rejected (%s): %s", attempt + 1, e.reason, e)
+            max_tokens = LLM_RETRY_MAX_TOKENS
+            continue
+        LLM_PARSE.labels("repaired" if repaired else "ok").inc()
+        if not repaired:
+            budget.observe(tokens)
+        return desc, tasks
 
 STUB = [
     "Сформулировать value-prop и ЦА",
@@ -76,22 +261,65 @@ STUB = [
     "Docker-compose, README, деплой",
 ]
 
-def generate_description_and_tasks(idea: str) -> Tuple[str, List[str]]:
-    key = "ai:roadmap:" + hashlib.sha256(idea.encode()).hexdigest()
-    if (cached := _cache_get(key)):
-        return cached["description"], cached["tasks"]
+async def generate_description_and_tasks(idea: str, on_event: OnEvent = None, user_key: str = "") -> Tuple[str, List[str]]:
+    """
+    on_event вызывается только если генерацию выполняет именно этот вызов;
+    при попадании в кэш или ожидании чужой генерации приходит сразу итог.
+    user_key — чей это запрос, для честной очереди. Бросает QueueFull.
+    """
+    key = roadmap_key(idea)
+    if not (result := await _cache.get(key)):
+        # лимит очереди — у каждого вызывающего свой: генерацию делят, а 429 владельца — нет
+        if router is not None:
+            queue.admit(user_key)
+        result = await _flight.do(key, lambda: _generate(idea, key, on_event, user_key), lambda: _cache.get(key))
+    return _unpack(result, idea)
+
+def _unpack(result: dict, idea: str) -> Tuple[str, List[str]]:
+    # у заглушки в кэше только задачи: ключ — нормализованная идея, её делят разные написания,
+    # а описание каждому строится из его собственного текста
+    if result.get("stub"):
+        return f"Идея: {idea}. Цель — быстро собрать MVP и проверить гипотезы.", result["tasks"]
+    return result["description"], result["tasks"]
+
+async def stream_description_and_tasks(idea: str, user_key: str = "") -> AsyncIterator[tuple]:
+    """
+    Та же генерация, но потоком событий: ("queued", position), ("description", text),
+    ("task", index, title)… и в конце ("done", description, tasks). ("reset",) — показанное
+    до него отброшено (повтор, другой сервер), описание и задачи придут заново.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    gen = asyncio.ensure_future(generate_description_and_tasks(idea, on_event=events.put_nowait, user_key=user_key))
+    gen.add_done_callback(lambda _: events.put_nowait(None))
+    try:
+        while (event := await events.get()) is not None:
+            yield event
+        desc, tasks = gen.result()
+        yield ("done", desc, tasks)
+    finally:
+        gen.cancel()
 
+async def _generate(idea: str, key: str, on_event: OnEvent, user_key: str) -> dict:
+    stub = False
     try:
-        if PROVIDER == "oss":
-            desc, tasks = _oss_generate(idea)
+        if router is not None:
+            desc, tasks = await queue.submit(
+                user_key,
+                lambda _slot: _llm_generate(idea, on_event),  # слоты раздаёт router
+                on_queued=(lambda pos: on_event(("queued", pos))) if on_event else None,
+                admit=False,
+            )
         else:
             raise RuntimeError("stub")
     except Exception:
-        desc = f"Идея: {idea}. Цель — быстро собрать MVP и проверить гипотезы."
         tasks = STUB
+        stub = True
+    LLM_GENERATIONS.labels("llm" if not stub else "stub_disabled" if router is None else "stub_error").inc()
 
-    _cache_set(key, {"description": desc, "tasks": tasks})
-    return desc, tasks
+    result = {"stub": True, "tasks": tasks} if stub else {"description": desc, "tasks": tasks}
+    # заглушку кэшируем ненадолго: лежащий LLM не дёргаем на каждый запрос, но и не залипаем на час
+    await _cache.set(key, result, negative=stub)
+    return result
 
 def review_progress(percent: float) -> str:
     if percent >= 80:
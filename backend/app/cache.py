@@ -0,0 +1,94 @@
+"""
+Кэши бэкенда: общий Redis-клиент и двухуровневый кэш (LRU/TTL в процессе → Redis).
+"""
+import os, json, time, logging
+from collections import OrderedDict
+from typing import Any, Optional
+from .metrics import CACHE_REQUESTS, CACHE_EVICTIONS, CACHE_ENTRIES
+
+# ---- Redis ----
+try:
+    import redis.asyncio as redis
+except Exception:
+    redis = None
+
+REDIS_URL = os.getenv("REDIS_URL")
+r = redis.from_url(REDIS_URL) if (redis and REDIS_URL) else None
+
+log = logging.getLogger(__name__)
+
+class TTLCache:
+    """LRU с TTL на запись. Не потокобезопасен — рассчитан на один event loop."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            CACHE_ENTRIES.labels(self.name).set(len(self._data))
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + min(ttl or self.ttl, self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            CACHE_EVICTIONS.labels(self.name).inc()
+        CACHE_ENTRIES.labels(self.name).set(len(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+class TwoTierCache:
+    """
+    Чтение: процесс → Redis (с прогревом локального уровня). Запись — в оба.
+    negative=True кладёт значение под отдельный ключ `<key>:neg` с коротким TTL:
+    так неудачные/заглушечные ответы не живут час и не перетирают настоящие.
+    """
+
+    def __init__(self, name: str, redis_client, local_size: int, local_ttl: float, ttl: int, negative_ttl: int):
+        self.name = name
+        self.r = redis_client
+        self.local = TTLCache(name, local_size, local_ttl)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    async def get(self, key: str):
+        value = self.local.get(key)
+        CACHE_REQUESTS.labels(self.name, "local", "hit" if value is not None else "miss").inc()
+        if value is not None or not self.r:
+            return value
+        try:
+            raw, raw_neg = await self.r.mget(key, f"{key}:neg")
+        except Exception:
+            log.warning("cache %s: Redis недоступен", self.name, exc_info=True)
+            return None
+        if raw or raw_neg:
+            CACHE_REQUESTS.labels(self.name, "redis", "hit").inc()
+            value = json.loads(raw or raw_neg)
+            self.local.set(key, value, None if raw else self.negative_ttl)
+            return value
+        CACHE_REQUESTS.labels(self.name, "redis", "miss").inc()
+        return None
+
+    async def set(self, key: str, value, negative: bool = False):
+        self.local.set(key, value, self.negative_ttl if negative else None)
+        if not self.r:
+            return
+        try:
+            if negative:
+                await self.r.setex(f"{key}:neg", self.negative_ttl, json.dumps(value, ensure_ascii=False))
+            else:
+                await self.r.setex(key, self.ttl, json.dumps(value, ensure_ascii=False))
+        except Exception:
+            log.warning("cache %s: Redis недоступен", self.name, exc_info=True)
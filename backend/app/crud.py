@@ -0,0 +1,67 @@
+import os
+from typing import List, Tuple
+from fastapi import HTTPException
+from sqlalchemy import select, update, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import Project, Task
+from .progress import on_projects_created, on_status_changes
+from .schemas import UpdateTaskIn
+
+TASKS_BULK_MAX = int(os.getenv("TASKS_BULK_MAX", "1000"))
+
+def check_bulk_size(items: List[UpdateTaskIn]):
+    """Размер пачки для PATCH /tasks и /admin/tasks: пустая — 422, больше TASKS_BULK_MAX — 413."""
+    if not items:
+        raise HTTPException(422, "Empty update list")
+    if len(items) > TASKS_BULK_MAX:
+        raise HTTPException(413, f"At most {TASKS_BULK_MAX} tasks per request")
+
+async def create_project(db: AsyncSession, user_id: int, idea: str, desc: str, tasks: List[str]) -> int:
+    """Проект с задачами и счётчиками, возвращает id; коммит — на вызывающем."""
+    return (await create_projects(db, user_id, [(idea[:120], desc, tasks)]))[0]
+
+async def create_projects(db: AsyncSession, user_id: int, items: List[Tuple[str, str, List[str]]]) -> List[int]:
+    """
+    Пачка проектов (title, description, tasks) одного пользователя:
+    INSERT ... RETURNING по проектам, executemany по задачам и счётчикам —
+    число запросов не зависит от размера пачки. Коммит — на вызывающем.
+    """
+    if not items:
+        return []
+    project_ids = (await db.scalars(
+        insert(Project).returning(Project.id, sort_by_parameter_order=True),
+        [{"user_id": user_id, "title": title, "description": desc} for title, desc, _ in items],
+    )).all()
+    rows = [
+        {"project_id": pid, "title": t, "order": i}
+        for pid, (_, _, tasks) in zip(project_ids, items) for i, t in enumerate(tasks)
+    ]
+    if rows:
+        await db.execute(insert(Task), rows)
+    await on_projects_created(db, user_id, [(pid, len(tasks)) for pid, (_, _, tasks) in zip(project_ids, items)])
+    return list(project_ids)
+
+async def update_statuses(db: AsyncSession, items: List[UpdateTaskIn]) -> List[dict]:
+    """
+    Смена статусов пачкой: один SELECT ... FOR UPDATE, один executemany UPDATE
+    и счётчики одним обновлением на проект; коммит — на вызывающем.
+    Повтор task_id в запросе — побеждает последний.
+    """
+    wanted = {i.task_id: i.status for i in items}
+    current = {
+        r.id: r for r in await db.execute(
+            select(Task.id, Task.project_id, Task.status)
+            .where(Task.id.in_(wanted))
+            .order_by(Task.id)  # одинаковый порядок блокировок — без дедлоков между пачками
+            .with_for_update()
+        )
+    }
+    changed = [(tid, status) for tid, status in wanted.items() if tid in current and current[tid].status != status]
+    if changed:
+        await db.execute(update(Task), [{"id": tid, "status": status} for tid, status in changed])
+        await on_status_changes(db, [(current[tid].project_id, current[tid].status, status) for tid, status in changed])
+    return [
+        {"task_id": tid, "ok": True, "status": status} if tid in current
+        else {"task_id": tid, "ok": False, "error": "Task not found"}
+        for tid, status in wanted.items()
+    ]
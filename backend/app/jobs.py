@@ -0,0 +1,74 @@
+"""
+Фоновые генерации по идее: POST возвращает job_id сразу, результат забирают опросом.
+
+Состояние задания — JSON в Redis (`ai:job:<id>`, TTL JOB_TTL); без Redis —
+в памяти процесса. Само задание выполняется в этом же процессе фоновой
+asyncio-задачей: при рестарте незавершённые задания остаются в статусе
+running до истечения TTL.
+"""
+import os, json, time, uuid, asyncio, logging
+from typing import Optional, Set
+from .cache import r, TTLCache
+from .db import SessionLocal
+from .ai_service import stream_description_and_tasks
+from .crud import create_project
+
+log = logging.getLogger(__name__)
+
+JOB_TTL = int(os.getenv("JOB_TTL", "3600"))
+
+_local = TTLCache("jobs", maxsize=10_000, ttl=JOB_TTL)
+_running: Set[asyncio.Task] = set()
+
+async def _save(job: dict):
+    if r:
+        await r.setex(f"ai:job:{job['id']}", JOB_TTL, json.dumps(job, ensure_ascii=False))
+    else:
+        _local.set(job["id"], dict(job))
+
+async def get_job(job_id: str) -> Optional[dict]:
+    if r:
+        raw = await r.get(f"ai:job:{job_id}")
+        return json.loads(raw) if raw else None
+    return _local.get(job_id)
+
+async def submit_idea_job(user_id: int, tg_id: str, idea: str) -> dict:
+    job = {
+        "id": uuid.uuid4().hex, "status": "queued", "tg_id": tg_id, "idea": idea,
+        "position": None, "description": None, "tasks": [], "project_id": None,
+        "error": None, "created_at": time.time(),
+    }
+    await _save(job)
+    task = asyncio.ensure_future(_run(job, user_id))
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return job
+
+async def _run(job: dict, user_id: int):
+    try:
+        async for event in stream_description_and_tasks(job["idea"], user_key=job["tg_id"]):
+            if event[0] == "queued":
+                job["position"] = event[1]
+            elif event[0] == "description":
+                job.update(status="running", description=event[1])
+            elif event[0] == "task":
+                job.update(status="running")
+                job["tasks"].append(event[2])
+            elif event[0] == "reset":
+                job.update(description=None, tasks=[])
+            elif event[0] == "done":
+                _, desc, tasks = event
+                async with SessionLocal() as db:
+                    project_id = await create_project(db, user_id, job["idea"], desc, tasks)
+                    await db.commit()
+                job.update(status="done", description=desc, tasks=tasks, project_id=project_id)
+            await _save(job)
+    except Exception as e:
+        log.exception("idea job %s failed", job["id"])
+        job.update(status="error", error=getattr(e, "detail", None) or str(e))
+        await _save(job)
+
+async def aclose():
+    for task in list(_running):
+        task.cancel()
+    await asyncio.gather(*_running, return_exceptions=True)
@@ -0,0 +1,203 @@
+"""Разбор JSON-ответов модели: целиком и инкрементально по мере стриминга."""
+import json, re
+from typing import List, Optional, Tuple
+
+EXPECTED_TASKS = 6
+
+# контракт ответа: для response_format=json_schema у llama.cpp и для проверки результата
+ROADMAP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "description": {"type": "string", "minLength": 1, "maxLength": 400},
+        "tasks": {
+            "type": "array",
+            "items": {"type": "string", "minLength": 1, "maxLength": 160},
+            "minItems": EXPECTED_TASKS,
+            "maxItems": EXPECTED_TASKS,
+        },
+    },
+    "required": ["description", "tasks"],
+    "additionalProperties": False,
+}
+
+# то же GBNF-грамматикой — для серверов llama.cpp без json_schema в response_format
+ROADMAP_GRAMMAR = r'''
+root   ::= "{" ws "\"description\"" ws ":" ws desc ws "," ws "\"tasks\"" ws ":" ws "[" ws task (ws "," ws task){5} ws "]" ws "}"
+desc   ::= "\"" char{1,400} "\""
+task   ::= "\"" char{1,160} "\""
+char   ::= [^"\\\x7F\x00-\x1F] | "\\" ( ["\\/bfnrt] | "u" [0-9a-fA-F]{4} )
+ws     ::= [ \t\n]{0,2}
+'''.strip()
+
+class RoadmapError(ValueError):
+    """Ответ модели не удалось превратить в роадмап. reason — метка для метрик."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason  # invalid_json | truncated | bad_shape
+
+class TolerantJSON:
+    """
+    Инкрементальный сканер первого JSON-объекта в тексте модели.
+    Мусор до `{` и после закрывающей `}` игнорируется. По ходу запоминаются
+    места, где значение закончилось; если ответ оборвался (max_tokens, обрыв
+    стрима), value() обрезает текст по последнему такому месту и дописывает
+    недостающие скобки — недописанная строка отбрасывается, а не склеивается.
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.start = -1
+        self.end: Optional[int] = None
+        self._pos = 0
+        self._stack: List[str] = []  # ожидаемые закрывающие скобки
+        self._want_key: List[bool] = []  # для объектов: следующая строка — ключ
+        self._in_str = self._esc = self._broken = False
+        self._safe: List[Tuple[int, str]] = []  # (позиция обрезки, хвост из скобок)
+
+    @property
+    def complete(self) -> bool:
+        """Объект закрылся — дальше модель может только мусорить."""
+        return self.end is not None
+
+    def feed(self, chunk: str):
+        self.buf += chunk
+        if self.end is not None or self._broken:
+            return
+        buf = self.buf
+        for i in range(self._pos, len(buf)):
+            ch = buf[i]
+            if self.start < 0:
+                if ch == "{":
+                    self.start = i
+                    self._open("}", i)
+                continue
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                    if self._want_key[-1]:
+                        self._want_key[-1] = False
+                    else:
+                        self._mark(i + 1)
+                continue
+            if ch == '"':
+                self._in_str = True
+            elif ch == "{" or ch == "[":
+                self._open("}" if ch == "{" else "]", i)
+            elif ch == "}" or ch == "]":
+                if ch != self._stack[-1]:
+                    self._broken = True  # дальше не JSON — спасаем то, что было до этого места
+                    break
+                self._stack.pop()
+                self._want_key.pop()
+                if not self._stack:
+                    self.end = i + 1
+                    break
+                self._mark(i + 1)
+            elif ch == ",":
+                self._mark(i)  # до запятой — законченное значение (в т.ч. число/литерал)
+                if self._stack[-1] == "}":
+                    self._want_key[-1] = True
+        self._pos = len(buf)
+
+    def _open(self, closer: str, i: int):
+        self._stack.append(closer)
+        self._want_key.append(closer == "}")
+        self._mark(i + 1)
+
+    def _mark(self, pos: int):
+        self._safe.append((pos, "".join(reversed(self._stack))))
+        del self._safe[:-16]
+
+    def value(self) -> Tuple[object, bool]:
+        """(объект, repaired). ValueError, если спасти нечего."""
+        if self.end is not None:
+            try:
+                return json.loads(self.buf[self.start:self.end]), False
+            except ValueError:
+                pass
+        for pos, tail in reversed(self._safe):
+            try:
+                return json.loads(self.buf[self.start:pos] + tail), True
+            except ValueError:
+                continue
+        raise ValueError("LLM: не удалось распарсить JSON")
+
+def extract_json(text: str):
+    text = (text or "").strip()
+    try:
+        return json.loads(text)
+    except Exception:
+        pass
+    scanner = TolerantJSON()
+    scanner.feed(text)
+    return scanner.value()[0]
+
+def parse_roadmap(scanner: TolerantJSON) -> Tuple[str, List[str], bool]:
+    """(description, ровно EXPECTED_TASKS задач, repaired) или RoadmapError."""
+    try:
+        data, repaired = scanner.value()
+    except ValueError as e:
+        raise RoadmapError("invalid_json", str(e))
+    if not isinstance(data, dict):
+        raise RoadmapError("bad_shape", "LLM: ответ не объект")
+    desc = data.get("description")
+    tasks = data.get("tasks")
+    desc = desc.strip() if isinstance(desc, str) else ""
+    tasks = [t.strip() for t in tasks if isinstance(t, str) and t.strip()] if isinstance(tasks, list) else []
+    if not desc or len(tasks) < EXPECTED_TASKS:
+        reason = "truncated" if repaired else "bad_shape"
+        raise RoadmapError(reason, f"LLM: description={bool(desc)}, задач {len(tasks)} из {EXPECTED_TASKS}")
+    return desc, tasks[:EXPECTED_TASKS], repaired
+
+_STR = r'"((?:[^"\\]|\\.)*)"'
+_DESCRIPTION = re.compile(r'"description"\s*:\s*' + _STR)
+_TASKS_START = re.compile(r'"tasks"\s*:\s*\[')
+_TASK_ITEM = re.compile(r'\s*' + _STR + r'\s*([,\]])')
+
+def _unescape(s: str) -> str:
+    try:
+        return json.loads(f'"{s}"')
+    except Exception:
+        return s
+
+class RoadmapStreamParser:
+    """
+    Достаёт из недописанного `{"description": "...", "tasks": ["...", ...]}`
+    уже завершённые поля. feed() возвращает только новые события:
+    ("description", text) и ("task", index, text).
+    """
+
+    def __init__(self, max_tasks: int = EXPECTED_TASKS):
+        self.buf = ""
+        self.description: Optional[str] = None
+        self.tasks: List[str] = []
+        self.max_tasks = max_tasks
+        self.json = TolerantJSON()
+
+    def feed(self, chunk: str) -> List[Tuple]:
+        self.buf += chunk
+        self.json.feed(chunk)
+        events: List[Tuple] = []
+        if self.description is None and (m := _DESCRIPTION.search(self.buf)):
+            self.description = _unescape(m.group(1)).strip()
+            events.append(("description", self.description))
+
+        m = _TASKS_START.search(self.buf)
+        if not m:
+            return events
+        pos, seen = m.end(), 0
+        while seen < self.max_tasks and (item := _TASK_ITEM.match(self.buf, pos)):
+            if seen >= len(self.tasks):
+                title = _unescape(item.group(1)).strip()
+                self.tasks.append(title)
+                events.append(("task", seen, title))
+            seen += 1
+            pos = item.end()
+            if item.group(2) == "]":
+                break
+        return events
@@ -0,0 +1,122 @@
+"""
+Очередь генераций перед LLM.
+
+Пул из N воркеров (N = числу слотов llama.cpp, --parallel) выбирает задания
+по кругу между пользователями: один пользователь с пачкой идей не занимает
+модель целиком. Глубина очереди и число заданий на пользователя ограничены;
+при переполнении submit() бросает QueueFull (→ 429).
+"""
+import asyncio, time, logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from .metrics import LLM_QUEUE_DEPTH, LLM_QUEUE_WAIT, LLM_QUEUE_REJECTED, LLM_QUEUE_BUSY
+
+log = logging.getLogger(__name__)
+
+class QueueFull(Exception):
+    def __init__(self, detail: str, depth: int, retry_after: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.depth = depth
+        self.retry_after = retry_after
+
+Job = Tuple[Callable[[int], Awaitable[Any]], asyncio.Future, float]
+
+class GenerationQueue:
+    def __init__(self, workers: int, max_depth: int, per_user: int, retry_after: int = 30):
+        self.workers = workers
+        self.max_depth = max_depth
+        self.per_user = per_user
+        self.retry_after = retry_after
+        self._jobs: Dict[str, Deque[Job]] = {}
+        self._turns: Deque[str] = deque()  # очередь пользователей для round-robin
+        self._ready: Optional[asyncio.Semaphore] = None
+        self._tasks: List[asyncio.Task] = []
+        self._depth = 0
+        self._busy = 0
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def admit(self, user_key: str):
+        """Проверка без постановки в очередь (для ответов, которые нельзя отменить после начала)."""
+        if self._depth >= self.max_depth:
+            LLM_QUEUE_REJECTED.labels("full").inc()
+            raise QueueFull("Очередь генерации переполнена, попробуйте позже", self._depth, self.retry_after)
+        if len(self._jobs.get(user_key, ())) >= self.per_user:
+            LLM_QUEUE_REJECTED.labels("per_user").inc()
+            raise QueueFull("Слишком много генераций в очереди, дождитесь предыдущих", self._depth, self.retry_after)
+
+    async def submit(self, user_key: str, fn: Callable[[int], Awaitable[Any]], on_queued: Optional[Callable[[int], None]] = None,
+                     admit: bool = True):
+        """
+        fn(slot) выполняется одним из воркеров; slot — номер воркера (0..workers-1).
+        on_queued(position) вызывается, если задание встало в очередь за другими.
+        admit=False — вызывающий уже проверил admit() сам (общая генерация нескольких запросов).
+        """
+        if admit:
+            self.admit(user_key)
+        self._start()
+        fut = asyncio.get_running_loop().create_future()
+        self._jobs.setdefault(user_key, deque()).append((fn, fut, time.monotonic()))
+        if user_key not in self._turns:
+            self._turns.append(user_key)
+        self._depth += 1
+        LLM_QUEUE_DEPTH.set(self._depth)
+        position = self._depth + self._busy - self.workers
+        if on_queued and position > 0:
+            on_queued(position)
+        self._ready.release()
+        return await fut
+
+    def _next(self) -> Job:
+        user_key = self._turns.popleft()
+        jobs = self._jobs[user_key]
+        job = jobs.popleft()
+        if jobs:
+            self._turns.append(user_key)
+        else:
+            del self._jobs[user_key]
+        self._depth -= 1
+        LLM_QUEUE_DEPTH.set(self._depth)
+        return job
+
+    async def _worker(self, slot: int):
+        while True:
+            await self._ready.acquire()
+            fn, fut, enqueued_at = self._next()
+            if fut.cancelled():
+                continue
+            LLM_QUEUE_WAIT.observe(time.monotonic() - enqueued_at)
+            self._busy += 1
+            LLM_QUEUE_BUSY.set(self._busy)
+            try:
+                result = await fn(slot)
+            except Exception as e:
+                if not fut.done():
+                    fut.set_exception(e)
+            else:
+                if not fut.done():
+                    fut.set_result(result)
+            finally:
+                self._busy -= 1
+                LLM_QUEUE_BUSY.set(self._busy)
+
+    def _start(self):
+        if self._tasks:
+            return
+        self._ready = asyncio.Semaphore(0)
+        self._tasks = [asyncio.ensure_future(self._worker(i)) for i in range(self.workers)]
+
+    async def aclose(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for jobs in self._jobs.values():
+            for _, fut, _ in jobs:
+                fut.cancel()
+        self._jobs.clear()
+        self._turns.clear()
+        self._depth = 0
@@ -0,0 +1,271 @@
+"""
+Несколько OpenAI-совместимых серверов за одним вызовом: выбор, failover и хедж.
+
+Серверы — LLM_BACKENDS, JSON-список:
+    [{"name": "gpu1", "url": "http://llm1:8080/v1", "model": "qwen2.5-3b-instruct", "slots": 2},
+     {"name": "gpu2", "url": "http://llm2:8080/v1", "model": "qwen2.5-3b-instruct", "slots": 2},
+     {"name": "openai", "kind": "openai", "url": "https://api.openai.com/v1",
+      "model": "gpt-4o-mini", "api_key": "sk-…", "slots": 4, "tier": 1}]
+Без него — один сервер по AI_PROVIDER: oss → OSS_*, openai → OPENAI_*.
+
+  • kind: llama — llama.cpp (id_slot, cache_prompt, grammar), openai — только стандартные поля;
+  • выбор: из живых серверов самого низкого tier — сначала те, где есть свободный слот,
+    среди них минимальная EWMA времени ответа × (1 + занятые/slots); сервер без замеров
+    пробуется первым. EWMA, которую давно не обновляли, стягивается к среднему по серверам
+    (полураспад LLM_EWMA_DECAY с): один медленный ответ не отрезает сервер навсегда;
+  • ошибка вызова → тот же запрос уходит на следующий сервер (failover);
+  • LLM_CB_FAILURES ошибок подряд выключают сервер на LLM_CB_RESET секунд, потом
+    через него пропускается один пробный запрос (half-open);
+  • LLM_HEDGE=1: если ответа нет дольше p90 последних генераций, запрос дублируется
+    на другой сервер того же tier; берётся первый успешный, второй отменяется.
+"""
+import os, json, time, asyncio, bisect, logging
+from collections import deque
+from typing import Awaitable, Callable, List, Optional, TypeVar
+import httpx
+from .metrics import LLM_BACKEND_STATE, LLM_BACKEND_LATENCY, LLM_FAILOVERS, LLM_HEDGES
+
+log = logging.getLogger(__name__)
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "8"))
+LLM_CB_FAILURES = int(os.getenv("LLM_CB_FAILURES", "3"))
+LLM_CB_RESET = float(os.getenv("LLM_CB_RESET", "30"))
+LLM_EWMA_ALPHA = float(os.getenv("LLM_EWMA_ALPHA", "0.2"))
+LLM_EWMA_DECAY = float(os.getenv("LLM_EWMA_DECAY", "30"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.9"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+T = TypeVar("T")
+
+class NoBackend(RuntimeError):
+    """Все серверы выключены предохранителями."""
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2  # значения gauge llm_backend_state
+
+    def __init__(self, failures: int = LLM_CB_FAILURES, reset: float = LLM_CB_RESET):
+        self.failures = failures
+        self.reset = reset
+        self.state = self.CLOSED
+        self._count = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset:
+            self.state, self._probing = self.HALF_OPEN, False
+        if self.state == self.HALF_OPEN:
+            return not self._probing
+        return self.state == self.CLOSED
+
+    def acquire(self):
+        if self.state == self.HALF_OPEN:
+            self._probing = True
+
+    def release(self):
+        """Пробный запрос отменён, а не упал — следующий снова может пробовать."""
+        self._probing = False
+
+    def success(self):
+        self.state, self._count, self._probing = self.CLOSED, 0, False
+
+    def failure(self):
+        self._count += 1
+        if self.state == self.HALF_OPEN or self._count >= self.failures:
+            self.state, self._opened_at, self._probing = self.OPEN, time.monotonic(), False
+
+class Backend:
+    def __init__(self, name: str, url: str, model: str, api_key: str = "local", slots: int = 1,
+                 kind: str = "llama", tier: int = 0):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.slots = max(1, int(slots))
+        self.kind = kind
+        self.tier = int(tier)
+        self.breaker = CircuitBreaker()
+        self.ewma: Optional[float] = None
+        self.ewma_at = 0.0
+        self.in_flight = 0
+        self._free_slots = list(range(self.slots))  # по возрастанию: младшие слоты — самые «тёплые»
+        self._client = None
+
+    @property
+    def client(self):
+        """Один AsyncOpenAI на сервер: keep-alive соединения переиспользуются."""
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(
+                base_url=self.url,
+                api_key=self.api_key,
+                max_retries=0,  # повторяет роутер — на другом сервере
+                http_client=httpx.AsyncClient(
+                    timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                    limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                ),
+            )
+        return self._client
+
+    @property
+    def full(self) -> bool:
+        return self.in_flight >= self.slots
+
+    def latency(self, mean: Optional[float], now: float) -> float:
+        """EWMA, со временем без замеров сползающая к mean (средней по серверам)."""
+        if self.ewma is None:
+            return 0.0
+        if mean is None or LLM_EWMA_DECAY <= 0:
+            return self.ewma
+        return mean + (self.ewma - mean) * 0.5 ** ((now - self.ewma_at) / LLM_EWMA_DECAY)
+
+    def score(self, mean: Optional[float] = None, now: float = 0.0) -> float:
+        return self.latency(mean, now) * (1 + self.in_flight / self.slots)
+
+    def take_slot(self) -> Optional[int]:
+        """Свободный слот llama.cpp; None — все заняты (хедж сверх слотов), сервер выберет сам."""
+        return self._free_slots.pop(0) if self._free_slots else None
+
+    def put_slot(self, slot: Optional[int]):
+        if slot is not None:
+            bisect.insort(self._free_slots, slot)
+
+    def observe(self, seconds: float):
+        self.ewma = seconds if self.ewma is None else LLM_EWMA_ALPHA * seconds + (1 - LLM_EWMA_ALPHA) * self.ewma
+        self.ewma_at = time.monotonic()
+        LLM_BACKEND_LATENCY.labels(self.name).set(self.ewma)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+def backends_from_env() -> List[Backend]:
+    raw = os.getenv("LLM_BACKENDS")
+    if raw:
+        return [Backend(**{"name": f"llm{i}", **spec}) for i, spec in enumerate(json.loads(raw))]
+    slots = int(os.getenv("LLM_PARALLEL", "1"))
+    if os.getenv("AI_PROVIDER") == "openai":
+        return [Backend("openai", os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+                        os.getenv("OPENAI_MODEL", "gpt-4o-mini"), os.getenv("OPENAI_API_KEY", ""),
+                        slots=slots, kind="openai")]
+    return [Backend("oss", os.getenv("OSS_BASE_URL", "http://llm:8080/v1"), os.getenv("OSS_MODEL", "gpt-oss-20b"),
+                    os.getenv("OSS_API_KEY", "local"), slots=slots)]
+
+# вызов на конкретном сервере: (сервер, слот llama.cpp или None)
+Call = Callable[[Backend, Optional[int]], Awaitable[T]]
+
+class Router:
+    def __init__(self, backends: List[Backend], hedge: bool = LLM_HEDGE, window: int = 200):
+        if not backends:
+            raise ValueError("LLM: не задано ни одного сервера")
+        self.backends = backends
+        self.hedge = hedge
+        self._latencies: deque = deque(maxlen=window)
+        for b in backends:
+            LLM_BACKEND_STATE.labels(b.name).set(b.breaker.state)
+
+    @property
+    def capacity(self) -> int:
+        """Слотов у основного (нижнего) tier — столько генераций имеет смысл пускать разом."""
+        tier = min(b.tier for b in self.backends)
+        return sum(b.slots for b in self.backends if b.tier == tier)
+
+    def candidates(self, exclude=()) -> List[Backend]:
+        alive = [b for b in self.backends if b not in exclude and b.breaker.allow()]
+        if not alive:
+            return []
+        tier = min(b.tier for b in alive)
+        pool = [b for b in alive if b.tier == tier]
+        known = [b.ewma for b in pool if b.ewma is not None]
+        mean, now = (sum(known) / len(known) if known else None), time.monotonic()
+        # занятые под завязку — в конец: запрос не встаёт в очередь сервера, пока другой простаивает;
+        # при равной оценке (в т.ч. у серверов без замеров) — менее загруженный
+        return sorted(pool, key=lambda b: (b.full, b.score(mean, now), b.in_flight / b.slots))
+
+    def hedge_after(self) -> Optional[float]:
+        if not self.hedge or len(self._latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * LLM_HEDGE_QUANTILE))]
+
+    async def run(self, call: Call) -> T:
+        """call на лучшем сервере; при ошибке — на следующем, пока есть живые."""
+        tried: List[Backend] = []
+        last: Optional[Exception] = None
+        while (candidates := self.candidates(tried)):
+            if tried:
+                LLM_FAILOVERS.inc()
+            tried.append(candidates[0])
+            try:
+                return await self._hedged(candidates, call, tried)
+            except Exception as e:
+                last = e
+                log.warning("llm call failed (%s): %r", ", ".join(b.name for b in tried), e)
+        raise last or NoBackend("LLM: нет доступных серверов")
+
+    async def _hedged(self, candidates: List[Backend], call: Call, tried: List[Backend]) -> T:
+        first = self._start(candidates[0], call)
+        tasks = [first]
+        try:
+            after = self.hedge_after() if len(candidates) > 1 else None
+            if after is None or (await asyncio.wait(tasks, timeout=after))[0]:
+                return await first
+            second = candidates[1]
+            if not second.breaker.allow():
+                return await first
+            tried.append(second)
+            LLM_HEDGES.labels("fired").inc()
+            tasks.append(self._start(second, call))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        LLM_HEDGES.labels("won" if task is not first else "lost").inc()
+                        return task.result()
+            return first.result()  # упали оба — отдаём ошибку основного
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _start(self, backend: Backend, call: Call) -> asyncio.Future:
+        """
+        Занять сервер синхронно, в момент выбора: пробный запрос half-open, слот и
+        in_flight видны следующему run() сразу, а не когда задача начнёт выполняться.
+        """
+        backend.breaker.acquire()
+        backend.in_flight += 1
+        slot = backend.take_slot()
+
+        def done(task: asyncio.Future):
+            backend.in_flight -= 1
+            backend.put_slot(slot)
+            if task.cancelled():  # в т.ч. отменена до первого шага
+                backend.breaker.release()
+            LLM_BACKEND_STATE.labels(backend.name).set(backend.breaker.state)
+
+        task = asyncio.ensure_future(self._attempt(backend, slot, call))
+        task.add_done_callback(done)
+        return task
+
+    async def _attempt(self, backend: Backend, slot: Optional[int], call: Call) -> T:
+        started = time.monotonic()
+        try:
+            result = await call(backend, slot)
+        except Exception:
+            backend.breaker.failure()
+            raise
+        elapsed = time.monotonic() - started
+        backend.observe(elapsed)
+        self._latencies.append(elapsed)
+        backend.breaker.success()
+        return result
+
+    async def aclose(self):
+        for b in self.backends:
+            await b.aclose()
@@ -1,13 +1,27 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from .db import Base, engine
+from .db import engine
 from .routers import users, projects, tasks, ai, admin
-from .scheduler import start_scheduler
+from .scheduler import start_scheduler, stop_scheduler
+from . import ai_service, jobs, metrics
+from .llm_queue import QueueFull
 import os
 
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # схема — миграциями: alembic upgrade head (см. Dockerfile)
+    start_scheduler()
+    yield
+    stop_scheduler()
+    await jobs.aclose()
+    await ai_service.aclose()
+    await engine.dispose()
 
-app = FastAPI(title="AI Project Tracker API")
+app = FastAPI(title="AI Project Tracker API", lifespan=lifespan)
+app.add_middleware(metrics.HttpMetrics)
+metrics.instrument_engine(engine.sync_engine)
 
 origins = [os.getenv("CORS_ORIGINS", "http://localhost:3000")]
 app.add_middleware(
@@ -18,14 +32,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(QueueFull)
+async def queue_full(request: Request, exc: QueueFull):
+    return JSONResponse(
+        {"detail": exc.detail, "queue_depth": exc.depth},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 app.include_router(users.router)
 app.include_router(projects.router)
 app.include_router(tasks.router)
 app.include_router(ai.router)
 app.include_router(admin.router)
+app.include_router(metrics.router)
 
 @app.get("/health")
 async def health():
     return {"ok": True}
-
-start_scheduler()
\ No newline at end of file
@@ -0,0 +1,170 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import APIRouter, Response
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+router = APIRouter(tags=["metrics"])
+
+SINGLEFLIGHT_COALESCED = Counter(
+    "singleflight_coalesced_total",
+    "Вызовы, получившие результат чужого запроса вместо своего",
+    ["name", "scope"],  # scope: local (тот же процесс) | remote (другой воркер через Redis)
+)
+SINGLEFLIGHT_TAKEOVERS = Counter(
+    "singleflight_takeovers_total",
+    "Лиз истёк без результата (владелец умер), генерацию перехватил ожидающий",
+    ["name"],
+)
+SINGLEFLIGHT_WAIT_TIMEOUTS = Counter(
+    "singleflight_wait_timeouts_total",
+    "Ожидающий не дождался результата и выполнил вызов сам",
+    ["name"],
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Обращения к кэшу по уровням; hit ratio = hit / (hit + miss)",
+    ["cache", "tier", "result"],  # tier: local | redis; result: hit | miss
+)
+CACHE_EVICTIONS = Counter("cache_evictions_total", "Вытеснения из локального LRU по размеру", ["cache"])
+CACHE_ENTRIES = Gauge("cache_entries", "Записей в локальном LRU", ["cache"])
+LLM_QUEUE_DEPTH = Gauge("llm_queue_depth", "Генераций ждут свободного слота LLM")
+LLM_QUEUE_BUSY = Gauge("llm_queue_busy_workers", "Занятые слоты LLM")
+LLM_QUEUE_WAIT = Histogram(
+    "llm_queue_wait_seconds", "Ожидание в очереди до начала генерации",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+LLM_QUEUE_REJECTED = Counter("llm_queue_rejected_total", "Отказы по переполнению очереди", ["reason"])
+TG_SENT = Counter("telegram_messages_total", "Отправки через Bot API", ["result"])  # ok | rejected | failed
+TG_RETRY_AFTER = Counter("telegram_retry_after_total", "Ответы 429 от Telegram")
+REPORT_USERS = Counter("daily_report_users_total", "Пользователи, обработанные рассылкой отчётов", ["result"])
+REPORT_DURATION = Gauge("daily_report_last_duration_seconds", "Длительность последней рассылки")
+REPORT_THROUGHPUT = Gauge("daily_report_last_throughput", "Сообщений в секунду в последней рассылке")
+REPORT_BATCH_DURATION = Histogram(
+    "daily_report_batch_seconds", "Отправка одной пачки отчётов",
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 40, 60, 120),
+)
+JOB_RUNS = Counter("scheduler_job_runs_total", "Запуски фоновых задач", ["job", "result"])  # done | failed
+JOB_DURATION = Histogram(
+    "scheduler_job_duration_seconds", "Длительность запуска фоновой задачи", ["job"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+
+# ---- HTTP ----
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP-запросы", ["method", "route", "status"])
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Время ответа (до отправки заголовков) по шаблону пути",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+# ---- БД ----
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Время одного SQL-запроса",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL-запросов на HTTP-запрос", ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds", "Суммарное время SQL на HTTP-запрос", ["route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+
+# ---- LLM ----
+LLM_REQUESTS = Counter("llm_requests_total", "Вызовы модели", ["backend", "result"])  # ok | error | cancelled
+LLM_LATENCY = Histogram(
+    "llm_request_duration_seconds", "Полное время вызова модели", ["backend"],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+LLM_TTFT = Histogram(
+    "llm_time_to_first_token_seconds", "Время до первого токена",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Токены (prompt — только из дочитанных до usage ответов)", ["kind"])  # prompt | prompt_cached | completion
+LLM_GENERATIONS = Counter("llm_generations_total", "Итог генерации роадмапа", ["source"])  # llm | stub_disabled | stub_error
+LLM_PARSE = Counter(
+    "llm_parse_total", "Разбор ответа модели", ["result"],
+)  # ok | repaired (дочинили обрыв) | invalid_json | truncated | bad_shape
+LLM_RETRIES = Counter("llm_retries_total", "Повторные генерации после отбракованного ответа")
+LLM_WASTED_TOKENS = Counter("llm_wasted_tokens_total", "Токены ответов, которые пришлось выбросить")
+LLM_EARLY_STOPS = Counter("llm_early_stops_total", "Стрим закрыт сразу после закрывающей скобки JSON")
+LLM_MAX_TOKENS_GAUGE = Gauge("llm_max_tokens", "Текущий max_tokens по наблюдаемым длинам ответов")
+LLM_PROMPT_EVAL = Histogram(
+    "llm_prompt_eval_seconds", "Обработка промпта на сервере (timings llama.cpp)",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+LLM_BACKEND_STATE = Gauge("llm_backend_state", "Предохранитель сервера: 0 закрыт, 1 пробный запрос, 2 выключен", ["backend"])
+LLM_BACKEND_LATENCY = Gauge("llm_backend_latency_seconds", "EWMA времени ответа сервера", ["backend"])
+LLM_FAILOVERS = Counter("llm_failovers_total", "Запрос переотправлен на другой сервер после ошибки")
+LLM_HEDGES = Counter("llm_hedges_total", "Хеджированные запросы", ["result"])  # fired | won (ответил дубль) | lost
+
+class _QueryStats:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+# статистика SQL текущего HTTP-запроса; вне запроса (планировщик, фоновые задачи) — None
+_query_stats: ContextVar[Optional[_QueryStats]] = ContextVar("query_stats", default=None)
+
+def instrument_engine(engine: Engine):
+    """Время каждого SQL-запроса + счётчики на текущий HTTP-запрос (engine.sync_engine для async)."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERY_LATENCY.observe(elapsed)
+        stats = _query_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+
+class HttpMetrics:
+    """
+    ASGI-middleware: латентность и статус по шаблону маршрута (/tasks/{task_id}, а не /tasks/42),
+    число и время SQL на запрос. Для стримов время — до заголовков ответа.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        stats = _QueryStats()
+        token = _query_stats.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                HTTP_LATENCY.labels(scope["method"], _route(scope)).observe(time.perf_counter() - started)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _query_stats.reset(token)
+            route = _route(scope)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status)).inc()
+            DB_QUERIES_PER_REQUEST.labels(route).observe(stats.count)
+            DB_TIME_PER_REQUEST.labels(route).observe(stats.seconds)
+
+def _route(scope) -> str:
+    # шаблон пути ставит роутер при совпадении; остальное — одной меткой, чтобы не плодить серии
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
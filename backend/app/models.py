@@ -1,9 +1,11 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, ForeignKey, Text, Enum
+from sqlalchemy import String, Integer, ForeignKey, Text, Enum, Index
 from sqlalchemy.sql import func
 from sqlalchemy.types import DateTime
 from .db import Base
 import enum
+from datetime import datetime
+from typing import Optional
 
 class TaskStatus(str, enum.Enum):
     pending = "pending"
@@ -17,13 +19,15 @@ class User(Base):
     name: Mapped[str] = mapped_column(String(120))
     email: Mapped[str] = mapped_column(String(255))
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # растёт при любой записи в проекты/задачи пользователя — основа ETag списка проектов
+    version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
 
     projects: Mapped[list["Project"]] = relationship(back_populates="user", cascade="all, delete-orphan")
 
 class Project(Base):
     __tablename__ = "projects"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
     title: Mapped[str] = mapped_column(String(255))
     description: Mapped[str] = mapped_column(Text)
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -34,10 +38,42 @@ class Project(Base):
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # (project_id, …) покрывает и выборку задач проекта, и счётчики по статусам
+        Index("ix_tasks_project_status", "project_id", "status"),
+        Index("ix_tasks_project_order", "project_id", "order"),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     project_id: Mapped[int] = mapped_column(ForeignKey("projects.id"))
     title: Mapped[str] = mapped_column(String(255))
     order: Mapped[int] = mapped_column(Integer, default=0)
     status: Mapped[TaskStatus] = mapped_column(Enum(TaskStatus), default=TaskStatus.pending)
 
-    project: Mapped[Project] = relationship(back_populates="tasks")
\ No newline at end of file
+    project: Mapped[Project] = relationship(back_populates="tasks")
+
+class ProjectStats(Base):
+    __tablename__ = "project_stats"
+    project_id: Mapped[int] = mapped_column(ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    pending: Mapped[int] = mapped_column(Integer, default=0)
+    in_progress: Mapped[int] = mapped_column(Integer, default=0)
+    done: Mapped[int] = mapped_column(Integer, default=0)
+
+class UserStats(Base):
+    __tablename__ = "user_stats"
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    pending: Mapped[int] = mapped_column(Integer, default=0)
+    in_progress: Mapped[int] = mapped_column(Integer, default=0)
+    done: Mapped[int] = mapped_column(Integer, default=0)
+
+class JobState(Base):
+    """Состояние периодической задачи: аренда (кто выполняет), время следующего запуска и курсор прогресса."""
+    __tablename__ = "job_state"
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    next_run_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    locked_by: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    locked_until: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    cursor: Mapped[int] = mapped_column(Integer, default=0)
+    last_finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,237 @@
+"""
+Прогресс по задачам.
+
+Счётчики total/pending/in_progress/done хранятся в project_stats и user_stats
+и обновляются в той же транзакции, что и запись задач (on_projects_created,
+on_status_change). Те же хуки увеличивают users.version — по нему строится
+ETag списка проектов. Чтение — одна строка по PK; если строки нет (данные до
+появления счётчиков), считаем агрегатом по tasks.
+
+    python -m app.progress rebuild   # пересчитать счётчики из tasks
+    python -m app.progress check     # сверить, exit 1 при расхождениях
+"""
+import sys, asyncio
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, func, case, update, delete, insert, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import User, Project, Task, TaskStatus, ProjectStats, UserStats
+
+def _count_status(status: TaskStatus):
+    return func.coalesce(func.sum(case((Task.status == status, 1), else_=0)), 0)
+
+_total = func.count(Task.id)
+_pending = _count_status(TaskStatus.pending)
+_in_progress = _count_status(TaskStatus.in_progress)
+_done = _count_status(TaskStatus.done)
+
+COUNTERS = ("total", "pending", "in_progress", "done")
+
+def percent(done: int, total: int) -> float:
+    return round((done / total) * 100, 2) if total else 0.0
+
+# ---- агрегаты по tasks ----
+async def user_progress(db: AsyncSession, tg_id: str) -> Optional[Tuple[int, int, int]]:
+    """(user_id, done, total) или None, если пользователя нет."""
+    row = (await db.execute(
+        select(User.id, _done, _total)
+        .outerjoin(Project, Project.user_id == User.id)
+        .outerjoin(Task, Task.project_id == Project.id)
+        .where(User.tg_id == tg_id)
+        .group_by(User.id)
+    )).first()
+    return tuple(row) if row else None
+
+async def project_progress(db: AsyncSession, project_id: int) -> Optional[Tuple[int, int, int]]:
+    """(project_id, done, total) или None, если проекта нет."""
+    row = (await db.execute(
+        select(Project.id, _done, _total)
+        .outerjoin(Task, Task.project_id == Project.id)
+        .where(Project.id == project_id)
+        .group_by(Project.id)
+    )).first()
+    return tuple(row) if row else None
+
+# ---- материализованные счётчики ----
+async def user_counters(db: AsyncSession, tg_id: str) -> Optional[Tuple[int, int, int]]:
+    """Как user_progress, но из user_stats за O(1)."""
+    row = (await db.execute(
+        select(User.id, UserStats.done, UserStats.total)
+        .outerjoin(UserStats, UserStats.user_id == User.id)
+        .where(User.tg_id == tg_id)
+    )).first()
+    if not row:
+        return None
+    if row.total is None:
+        return await user_progress(db, tg_id)
+    return tuple(row)
+
+async def project_counters(db: AsyncSession, project_id: int) -> Optional[Tuple[int, int, int]]:
+    """Как project_progress, но из project_stats за O(1)."""
+    row = (await db.execute(
+        select(ProjectStats.project_id, ProjectStats.done, ProjectStats.total)
+        .where(ProjectStats.project_id == project_id)
+    )).first()
+    return tuple(row) if row else await project_progress(db, project_id)
+
+async def user_batch(db: AsyncSession, after_id: int = 0, limit: int = 500) -> List[Tuple[int, str, int, int]]:
+    """
+    Следующая пачка (user_id, tg_id, done, total) после after_id (keyset по users.id).
+    Прогресс берётся из user_stats; для пользователей без строки — одним GROUP BY на пачку.
+    """
+    rows = (await db.execute(
+        select(User.id, User.tg_id, UserStats.done, UserStats.total)
+        .outerjoin(UserStats, UserStats.user_id == User.id)
+        .where(User.id > after_id)
+        .order_by(User.id)
+        .limit(limit)
+    )).all()
+    missing = [r.id for r in rows if r.total is None]
+    if missing:
+        actual = {uid: (done, total) for uid, done, total in await db.execute(
+            select(User.id, _done, _total)
+            .outerjoin(Project, Project.user_id == User.id)
+            .outerjoin(Task, Task.project_id == Project.id)
+            .where(User.id.in_(missing))
+            .group_by(User.id)
+        )}
+        rows = [(r.id, r.tg_id, *actual[r.id]) if r.total is None else tuple(r) for r in rows]
+    return [tuple(r) for r in rows]
+
+async def _bump(db: AsyncSession, project_id: int, user_id, deltas: Dict[str, int]):
+    await _touch(db, user_id)
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    if project_id is not None:
+        await db.execute(
+            update(ProjectStats)
+            .where(ProjectStats.project_id == project_id)
+            .values({getattr(ProjectStats, k): getattr(ProjectStats, k) + v for k, v in deltas.items()})
+        )
+    await db.execute(
+        update(UserStats)
+        .where(UserStats.user_id == user_id)
+        .values({getattr(UserStats, k): getattr(UserStats, k) + v for k, v in deltas.items()})
+    )
+
+async def _touch(db: AsyncSession, user_id):
+    await db.execute(update(User).where(User.id == user_id).values(version=User.version + 1))
+
+def on_user_created(db: AsyncSession, user_id: int):
+    db.add(UserStats(user_id=user_id, total=0, pending=0, in_progress=0, done=0))
+
+async def on_projects_created(db: AsyncSession, user_id: int, projects: List[Tuple[int, int]]):
+    """Новые проекты (project_id, число задач в pending): строки project_stats сразу с итогами."""
+    await db.execute(insert(ProjectStats), [
+        {"project_id": pid, "user_id": user_id, "total": n, "pending": n, "in_progress": 0, "done": 0}
+        for pid, n in projects
+    ])
+    n = sum(n for _, n in projects)
+    await _bump(db, None, user_id, {"total": n, "pending": n})
+
+async def on_status_change(db: AsyncSession, project_id: int, old: TaskStatus, new: TaskStatus):
+    if old == new:
+        return
+    user_id = select(Project.user_id).where(Project.id == project_id).scalar_subquery()
+    await _bump(db, project_id, user_id, {old.value: -1, new.value: 1})
+
+async def on_status_changes(db: AsyncSession, changes: Iterable[Tuple[int, TaskStatus, TaskStatus]]):
+    """Пакетный on_status_change: (project_id, old, new) — два executemany на всю пачку."""
+    by_project: Dict[int, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for project_id, old, new in changes:
+        if old != new:
+            by_project[project_id][old.value] -= 1
+            by_project[project_id][new.value] += 1
+    if not by_project:
+        return
+    owners = dict((await db.execute(select(Project.id, Project.user_id).where(Project.id.in_(by_project)))).all())
+    by_user: Dict[int, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for project_id, deltas in by_project.items():
+        for k, v in deltas.items():
+            by_user[owners[project_id]][k] += v
+    await _bump_many(db, ProjectStats.__table__, "project_id", by_project)
+    await _bump_many(db, UserStats.__table__, "user_id", by_user)
+    users = User.__table__
+    await db.execute(
+        update(users).where(users.c.id == bindparam("k")).values(version=users.c.version + 1),
+        [{"k": uid} for uid in by_user],
+    )
+
+async def _bump_many(db: AsyncSession, table, key: str, deltas: Dict[int, Dict[str, int]]):
+    # Core-таблица: ORM update() со списком параметров ушёл бы в bulk-by-PK без выражений
+    stmt = (
+        update(table)
+        .where(table.c[key] == bindparam("k"))
+        .values({c: table.c[c] + bindparam(f"d_{c}") for c in COUNTERS})
+    )
+    await db.execute(stmt, [{"k": k, **{f"d_{c}": d[c] for c in COUNTERS}} for k, d in deltas.items()])
+
+# ---- rebuild / check ----
+async def _project_rows(db: AsyncSession):
+    return (await db.execute(
+        select(Project.id, Project.user_id, _total, _pending, _in_progress, _done)
+        .outerjoin(Task, Task.project_id == Project.id)
+        .group_by(Project.id, Project.user_id)
+    )).all()
+
+async def _user_rows(db: AsyncSession):
+    return (await db.execute(
+        select(User.id, _total, _pending, _in_progress, _done)
+        .outerjoin(Project, Project.user_id == User.id)
+        .outerjoin(Task, Task.project_id == Project.id)
+        .group_by(User.id)
+    )).all()
+
+async def rebuild(db: AsyncSession) -> Tuple[int, int]:
+    """Пересчитать все счётчики из tasks в одной транзакции. Возвращает (projects, users)."""
+    projects, users = await _project_rows(db), await _user_rows(db)
+    await db.execute(delete(ProjectStats))
+    await db.execute(delete(UserStats))
+    if projects:
+        await db.execute(insert(ProjectStats), [dict(zip(("project_id", "user_id", *COUNTERS), r)) for r in projects])
+    if users:
+        await db.execute(insert(UserStats), [dict(zip(("user_id", *COUNTERS), r)) for r in users])
+    await db.commit()
+    return len(projects), len(users)
+
+async def check(db: AsyncSession) -> List[str]:
+    """Расхождения счётчиков с фактическими данными (пустой список — всё сходится)."""
+    problems = []
+    stored = {r[0]: tuple(r[1:]) for r in await db.execute(select(ProjectStats.project_id, *(getattr(ProjectStats, c) for c in COUNTERS)))}
+    for pid, _, *actual in await _project_rows(db):
+        got = stored.pop(pid, None)
+        if got != tuple(actual):
+            problems.append(f"project {pid}: stored={got} actual={tuple(actual)}")
+    problems += [f"project {pid}: stale row" for pid in stored]
+
+    stored = {r[0]: tuple(r[1:]) for r in await db.execute(select(UserStats.user_id, *(getattr(UserStats, c) for c in COUNTERS)))}
+    for uid, *actual in await _user_rows(db):
+        got = stored.pop(uid, None)
+        if got != tuple(actual):
+            problems.append(f"user {uid}: stored={got} actual={tuple(actual)}")
+    problems += [f"user {uid}: stale row" for uid in stored]
+    return problems
+
+async def main(argv=None) -> int:
+    from .db import SessionLocal, engine
+    cmd = (argv or sys.argv[1:] or ["check"])[0]
+    try:
+        async with SessionLocal() as db:
+            if cmd == "rebuild":
+                projects, users = await rebuild(db)
+                print(f"rebuilt: {projects} projects, {users} users")
+                return 0
+            if cmd == "check":
+                problems = await check(db)
+                for p in problems:
+                    print(p)
+                print("ok" if not problems else f"{len(problems)} mismatches")
+                return 1 if problems else 0
+            print("usage: python -m app.progress [rebuild|check]")
+            return 2
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,42 +1,146 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ..db import get_db
+import json
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from ..db import get_db, SessionLocal
 from ..models import User, Task, TaskStatus, Project
-from ..schemas import AdminLoginIn, AdminTokenOut
+from ..schemas import AdminLoginIn, AdminTokenOut, AdminUsersPage, UpdateTaskIn, BulkUpdateOut
 from ..auth import create_admin_token, require_admin
+from ..progress import on_status_change
+from ..crud import update_statuses, check_bulk_size
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 from os import getenv
 ADMIN_EMAIL = getenv("ADMIN_EMAIL")
 ADMIN_PASSWORD = getenv("ADMIN_PASSWORD")
+ADMIN_PAGE_MAX = int(getenv("ADMIN_PAGE_MAX", "200"))
+EXPORT_BATCH = int(getenv("ADMIN_EXPORT_BATCH", "1000"))
 
 @router.post("/login", response_model=AdminTokenOut)
-def login(payload: AdminLoginIn):
+async def login(payload: AdminLoginIn):
     if payload.email == ADMIN_EMAIL and payload.password == ADMIN_PASSWORD:
         return {"access_token": create_admin_token(payload.email)}
     raise HTTPException(401, "Invalid credentials")
 
-@router.get("/users")
-def users(db: Session = Depends(get_db), _=Depends(require_admin)):
-    data = []
-    for u in db.query(User).all():
-        projects = []
-        for p in u.projects:
-            projects.append({
-                "id": p.id,
-                "title": p.title,
-                "description": p.description,
-                "tasks": [{"id": t.id, "title": t.title, "order": t.order, "status": t.status} for t in p.tasks]
-            })
-        data.append({"id": u.id, "tg_id": u.tg_id, "name": u.name, "email": u.email, "projects": projects})
-    return {"users": data}
+def _like(text: str) -> str:
+    """Подстрока для ILIKE: %, _ и \\ из запроса ищутся буквально (escape="\\")."""
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def _user_filters(stmt, status: Optional[TaskStatus], user: Optional[str]):
+    if user:
+        like = _like(user)
+        stmt = stmt.where(or_(
+            User.tg_id == user,
+            User.name.ilike(like, escape="\\"),
+            User.email.ilike(like, escape="\\"),
+            User.projects.any(or_(Project.title.ilike(like, escape="\\"), Project.description.ilike(like, escape="\\"))),
+        ))
+    if status:
+        stmt = stmt.where(User.projects.any(Project.tasks.any(Task.status == status)))
+    return stmt
+
+@router.get("/users", response_model=AdminUsersPage)
+async def users(
+    cursor: int = 0,
+    limit: int = Query(50, ge=1, le=ADMIN_PAGE_MAX),
+    status: Optional[TaskStatus] = None,
+    user: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    _=Depends(require_admin),
+):
+    """
+    Страница пользователей после cursor (users.id) с проектами и задачами.
+    status — только задачи в этом статусе (и их проекты/пользователи),
+    user — tg_id целиком или подстрока имени/email, названия/описания проекта. Следующая страница — ?cursor=next_cursor.
+    """
+    projects, tasks = User.projects, Project.tasks
+    if status:
+        projects = User.projects.and_(Project.tasks.any(Task.status == status))
+        tasks = Project.tasks.and_(Task.status == status)
+    stmt = _user_filters(select(User).where(User.id > cursor), status, user)
+    rows = (await db.scalars(
+        stmt.order_by(User.id).limit(limit + 1)
+        .options(selectinload(projects).selectinload(tasks))
+    )).all()
+    page = rows[:limit]
+    return {"users": page, "next_cursor": page[-1].id if len(rows) > limit else None}
+
+@router.get("/users/export")
+async def export_users(
+    format: str = Query("ndjson", pattern="^(ndjson|json)$"),
+    status: Optional[TaskStatus] = None,
+    user: Optional[str] = None,
+    _=Depends(require_admin),
+):
+    """
+    Полная выгрузка в том же формате, что /admin/users: NDJSON (пользователь на строку)
+    или JSON-массив. Один плоский JOIN через серверный курсор — память не растёт с размером таблиц.
+    """
+    join = (Task.project_id == Project.id) & (Task.status == status) if status else Task.project_id == Project.id
+    stmt = _user_filters(
+        select(User.id, User.tg_id, User.name, User.email,
+               Project.id, Project.title, Project.description,
+               Task.id, Task.title, Task.order, Task.status)
+        .outerjoin(Project, Project.user_id == User.id)
+        .outerjoin(Task, join),
+        status, user,
+    ).order_by(User.id, Project.id, Task.order, Task.id).execution_options(yield_per=EXPORT_BATCH)
+
+    async def users_stream():
+        # сессия из Depends к началу стрима уже закрыта — берём свою
+        async with SessionLocal() as db:
+            result = await db.stream(stmt)
+            current = None
+            async for uid, tg_id, name, email, pid, title, desc, tid, ttitle, order, tstatus in result:
+                if current is None or current["id"] != uid:
+                    if current is not None:
+                        yield current
+                    current = {"id": uid, "tg_id": tg_id, "name": name, "email": email, "projects": []}
+                if pid is None or (status and tid is None):
+                    continue
+                projects = current["projects"]
+                if not projects or projects[-1]["id"] != pid:
+                    projects.append({"id": pid, "title": title, "description": desc, "tasks": []})
+                if tid is not None:
+                    projects[-1]["tasks"].append({"id": tid, "title": ttitle, "order": order, "status": tstatus.value})
+            if current is not None:
+                yield current
+
+    async def body():
+        first = True
+        if format == "json":
+            yield b"["
+        async for u in users_stream():
+            line = json.dumps(u, ensure_ascii=False)
+            if format == "json":
+                yield ((b"" if first else b",") + line.encode())
+            else:
+                yield (line + "\n").encode()
+            first = False
+        if format == "json":
+            yield b"]"
+
+    media_type = "application/json" if format == "json" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="users.{format}"'})
 
 @router.patch("/tasks/{task_id}")
-def admin_update_task(task_id: int, status: TaskStatus, db: Session = Depends(get_db), _=Depends(require_admin)):
-    task = db.get(Task, task_id)
+async def admin_update_task(task_id: int, status: TaskStatus, db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+    task = await db.get(Task, task_id, with_for_update=True)
     if not task:
         raise HTTPException(404, "Task not found")
+    await on_status_change(db, task.project_id, task.status, status)
     task.status = status
-    db.commit()
-    return {"ok": True}
\ No newline at end of file
+    await db.commit()
+    return {"ok": True}
+
+@router.patch("/tasks", response_model=BulkUpdateOut)
+async def admin_update_tasks(items: List[UpdateTaskIn], db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+    check_bulk_size(items)
+    results = await update_statuses(db, items)
+    await db.commit()
+    return {"results": results}
@@ -1,30 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..db import get_db
-from ..models import User, Project, Task, TaskStatus
 from ..ai_service import review_progress
+from ..progress import user_counters, project_counters, percent
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
 @router.get("/report/{tg_id}")
-def report(tg_id: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter_by(tg_id=tg_id).first()
-    if not user:
+async def report(tg_id: str, db: AsyncSession = Depends(get_db)):
+    row = await user_counters(db, tg_id)
+    if not row:
         raise HTTPException(404, "User not found")
-    tasks = [t for p in user.projects for t in p.tasks]
-    total = len(tasks)
-    done = len([t for t in tasks if t.status == TaskStatus.done])
-    percent = round((done / total) * 100, 2) if total else 0.0
-    comment = review_progress(percent)
-    return {"percent": percent, "comment": comment}
+    _, done, total = row
+    p = percent(done, total)
+    return {"percent": p, "comment": review_progress(p)}
 
 @router.post("/review/{project_id}")
-def review(project_id: int, db: Session = Depends(get_db)):
-    project = db.get(Project, project_id)
-    if not project:
+async def review(project_id: int, db: AsyncSession = Depends(get_db)):
+    row = await project_counters(db, project_id)
+    if not row:
         raise HTTPException(404, "Project not found")
-    total = len(project.tasks)
-    done = len([t for t in project.tasks if t.status == TaskStatus.done])
-    percent = round((done / total) * 100, 2) if total else 0.0
-    comment = review_progress(percent)
-    return {"percent": percent, "comment": comment}
\ No newline at end of file
+    _, done, total = row
+    p = percent(done, total)
+    return {"percent": p, "comment": review_progress(p)}
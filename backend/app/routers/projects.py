@@ -1,22 +1,85 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import os, csv, io
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..db import get_db
-from ..models import User, Project, Task, TaskStatus
-from ..schemas import IdeaIn
-from ..ai_service import generate_description_and_tasks
+from ..models import User
+from ..schemas import IdeaIn, ProjectImportItem, ProjectsImportIn, ImportOut
+from ..ai_service import generate_description_and_tasks, queue
+from ..crud import create_project, create_projects
+from ..jobs import submit_idea_job, get_job
 
 router = APIRouter(prefix="/projects", tags=["projects"])
 
+IMPORT_MAX_PROJECTS = int(os.getenv("IMPORT_MAX_PROJECTS", "10000"))
+
+async def _user_id(db: AsyncSession, tg_id: str) -> int:
+    user_id = (await db.scalars(select(User.id).filter_by(tg_id=tg_id))).first()
+    if not user_id:
+        raise HTTPException(404, "User not found")
+    # отдаём соединение в пул на время генерации — LLM может думать десятки секунд
+    await db.rollback()
+    return user_id
+
 @router.post("/idea")
-def create_from_idea(payload: IdeaIn, db: Session = Depends(get_db)):
-    user = db.query(User).filter_by(tg_id=payload.tg_id).first()
-    if not user:
+async def create_from_idea(payload: IdeaIn, db: AsyncSession = Depends(get_db)):
+    user_id = await _user_id(db, payload.tg_id)
+    desc, tasks = await generate_description_and_tasks(payload.idea, user_key=payload.tg_id)
+    project_id = await create_project(db, user_id, payload.idea, desc, tasks)
+    await db.commit()
+    return {"project_id": project_id, "description": desc, "tasks": tasks}
+
+@router.post("/idea/jobs", status_code=202)
+async def create_idea_job(payload: IdeaIn, db: AsyncSession = Depends(get_db)):
+    """
+    Как POST /idea, но не держит соединение на время генерации: сразу отдаёт
+    job_id, а проект и задачи появляются в GET /projects/idea/jobs/{job_id}.
+    """
+    user_id = await _user_id(db, payload.tg_id)
+    queue.admit(payload.tg_id)
+    job = await submit_idea_job(user_id, payload.tg_id, payload.idea)
+    return {"job_id": job["id"], "status": job["status"]}
+
+@router.get("/idea/jobs/{job_id}")
+async def idea_job(job_id: str):
+    """status: queued → running → done | error; до done в tasks — уже готовые задачи."""
+    job = await get_job(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return job
+
+async def _import(db: AsyncSession, tg_id: str, items: List[ProjectImportItem]) -> dict:
+    if len(items) > IMPORT_MAX_PROJECTS:
+        raise HTTPException(413, f"At most {IMPORT_MAX_PROJECTS} projects per import")
+    user_id = (await db.scalars(select(User.id).filter_by(tg_id=tg_id))).first()
+    if not user_id:
         raise HTTPException(404, "User not found")
-    desc, tasks = generate_description_and_tasks(payload.idea)
-    project = Project(user_id=user.id, title=payload.idea[:120], description=desc)
-    db.add(project)
-    db.flush()
-    for i, t in enumerate(tasks):
-        db.add(Task(project_id=project.id, title=t, order=i))
-    db.commit()
-    return {"project_id": project.id, "description": desc, "tasks": tasks}
\ No newline at end of file
+    project_ids = await create_projects(db, user_id, [(p.title, p.description, p.tasks) for p in items])
+    await db.commit()
+    return {"project_ids": project_ids, "tasks": sum(len(p.tasks) for p in items)}
+
+@router.post("/import", response_model=ImportOut)
+async def import_projects(payload: ProjectsImportIn, db: AsyncSession = Depends(get_db)):
+    """Готовые проекты с задачами (перенос бэклога) — одной транзакцией, без генерации."""
+    return await _import(db, payload.tg_id, payload.projects)
+
+@router.post("/import/csv", response_model=ImportOut)
+async def import_projects_csv(tg_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    То же из CSV в теле запроса: колонки title, description, tasks;
+    задачи внутри ячейки разделены «;».
+    """
+    try:
+        rows = list(csv.DictReader(io.StringIO((await request.body()).decode("utf-8-sig"))))
+        items = [
+            ProjectImportItem(
+                title=r["title"].strip(),
+                description=(r.get("description") or "").strip(),
+                tasks=[t.strip() for t in (r.get("tasks") or "").split(";") if t.strip()],
+            )
+            for r in rows
+        ]
+    except (KeyError, ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(422, f"Bad CSV: {e}")
+    return await _import(db, tg_id, items)
@@ -1,15 +1,27 @@
+from typing import List
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..db import get_db
 from ..models import Task, TaskStatus
+from ..schemas import UpdateTaskIn, BulkUpdateOut
+from ..progress import on_status_change
+from ..crud import update_statuses, check_bulk_size
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
+@router.patch("", response_model=BulkUpdateOut)
+async def update_tasks(items: List[UpdateTaskIn], db: AsyncSession = Depends(get_db)):
+    check_bulk_size(items)
+    results = await update_statuses(db, items)
+    await db.commit()
+    return {"results": results}
+
 @router.patch("/{task_id}")
-def update_task(task_id: int, status: TaskStatus, db: Session = Depends(get_db)):
-    task = db.get(Task, task_id)
+async def update_task(task_id: int, status: TaskStatus, db: AsyncSession = Depends(get_db)):
+    task = await db.get(Task, task_id, with_for_update=True)
     if not task:
         raise HTTPException(404, "Task not found")
+    await on_status_change(db, task.project_id, task.status, status)
     task.status = status
-    db.commit()
-    return {"ok": True}
\ No newline at end of file
+    await db.commit()
+    return {"ok": True}
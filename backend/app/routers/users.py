@@ -1,34 +1,72 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from ..db import get_db
-from ..models import User
-from ..schemas import UserRegisterIn
+from ..models import User, Project
+from ..schemas import UserRegisterIn, ProjectsOut
+from ..progress import on_user_created
+from ..cache import r, TwoTierCache
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+_cache = TwoTierCache(
+    "projects", r,
+    local_size=int(os.getenv("PROJECTS_CACHE_LOCAL_SIZE", "1024")),
+    local_ttl=float(os.getenv("PROJECTS_CACHE_LOCAL_TTL", "60")),
+    ttl=int(os.getenv("PROJECTS_CACHE_TTL", "600")),
+    negative_ttl=0,
+)
+
 @router.post("/register")
-def register(payload: UserRegisterIn, db: Session = Depends(get_db)):
-    user = db.query(User).filter_by(tg_id=payload.tg_id).first()
+async def register(payload: UserRegisterIn, db: AsyncSession = Depends(get_db)):
+    user = (await db.scalars(select(User).filter_by(tg_id=payload.tg_id))).first()
     if user:
         user.name = payload.name
         user.email = payload.email
     else:
         user = User(tg_id=payload.tg_id, name=payload.name, email=payload.email)
         db.add(user)
-    db.commit()
+        await db.flush()
+        on_user_created(db, user.id)
+    await db.commit()
     return {"ok": True}
 
-@router.get("/{tg_id}/projects")
-def list_projects(tg_id: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter_by(tg_id=tg_id).first()
-    if not user:
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or etag.removeprefix("W/") in tags
+
+@router.get("/{tg_id}/projects", response_model=ProjectsOut)
+async def list_projects(tg_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    ETag — версия пользователя (users.version): If-None-Match совпал → 304 после
+    одного запроса. Тело кэшируется по ключу с версией, поэтому любая запись
+    в проекты/задачи «инвалидирует» кэш без явного удаления.
+    """
+    row = (await db.execute(select(User.id, User.version).where(User.tg_id == tg_id))).first()
+    if not row:
         raise HTTPException(404, "User not found")
-    data = []
-    for p in user.projects:
-        data.append({
-            "id": p.id,
-            "title": p.title,
-            "description": p.description,
-            "tasks": [{"id": t.id, "title": t.title, "order": t.order, "status": t.status} for t in p.tasks]
-        })
-    return {"projects": data}
\ No newline at end of file
+    etag = f'W/"{row.id}.{row.version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    key = f"projects:{row.id}:{row.version}"
+    body = await _cache.get(key)
+    if body is None:
+        # 2 запроса независимо от числа проектов: selectin projects, selectin tasks
+        projects = (await db.scalars(
+            select(Project)
+            .where(Project.user_id == row.id)
+            .order_by(Project.id)
+            .options(selectinload(Project.tasks))
+        )).all()
+        # сразу в JSON, без промежуточного dict и второй сериализации;
+        # в кэше — готовый текст ответа
+        body = ProjectsOut.model_validate({"projects": projects}, from_attributes=True).model_dump_json()
+        await _cache.set(key, body)
+    return Response(body, media_type="application/json", headers=headers)
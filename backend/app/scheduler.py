@@ -1,32 +1,169 @@
-import os
-from apscheduler.schedulers.background import BackgroundScheduler
-from sqlalchemy.orm import Session
-import httpx
+"""
+Периодические задачи.
+
+Планировщик запущен в каждом воркере/реплике, но выполняет задачу только тот,
+кто взял аренду в job_state атомарным UPDATE (next_run_at наступил и чужая
+аренда истекла). Пока задача идёт, аренда продлевается heartbeat'ом, а
+прогресс рассылки (последний users.id) сохраняется после каждой пачки —
+после падения следующий экземпляр продолжит с курсора, а не с начала.
+Доставка at-least-once: пачка, прерванная посередине, будет отправлена снова.
+"""
+import os, time, uuid, socket, asyncio, logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import update, select
+from sqlalchemy.exc import IntegrityError
 from .db import SessionLocal
-from .models import User, TaskStatus
+from .models import JobState
+from .progress import user_batch, percent
+from .telegram import TelegramSender
+from .metrics import REPORT_USERS, REPORT_DURATION, REPORT_THROUGHPUT, REPORT_BATCH_DURATION, JOB_RUNS, JOB_DURATION
+
+log = logging.getLogger(__name__)
 
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TG_API = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+REPORT_BATCH_SIZE = int(os.getenv("REPORT_BATCH_SIZE", "500"))
+REPORT_RATE = float(os.getenv("REPORT_RATE", "25"))  # сообщений/с, у Telegram потолок ~30
+REPORT_CONCURRENCY = int(os.getenv("REPORT_CONCURRENCY", "20"))
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+SCHEDULER_TICK = int(os.getenv("SCHEDULER_TICK", "60"))
+JOB_LEASE = int(os.getenv("JOB_LEASE", "120"))
 
-scheduler = BackgroundScheduler()
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
 
-async def send_daily_reports():
-    if not BOT_TOKEN:
+scheduler = AsyncIOScheduler()
+
+Checkpoint = Callable[[int], Awaitable[None]]
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+class LeaseLost(Exception):
+    pass
+
+# ---- аренда в job_state ----
+async def _ensure_job(name: str, interval: timedelta):
+    async with SessionLocal() as db:
+        if await db.get(JobState, name):
+            return
+        db.add(JobState(name=name, next_run_at=_now() + interval, cursor=0))
+        try:
+            await db.commit()
+        except IntegrityError:  # параллельно создал другой экземпляр
+            await db.rollback()
+
+async def _acquire(name: str) -> bool:
+    now = _now()
+    async with SessionLocal() as db:
+        res = await db.execute(
+            update(JobState)
+            .where(JobState.name == name, JobState.next_run_at <= now,
+                   (JobState.locked_until.is_(None)) | (JobState.locked_until < now))
+            .values(locked_by=INSTANCE_ID, locked_until=now + timedelta(seconds=JOB_LEASE))
+        )
+        await db.commit()
+        return res.rowcount == 1
+
+async def _owned_update(name: str, **values) -> bool:
+    async with SessionLocal() as db:
+        res = await db.execute(
+            update(JobState)
+            .where(JobState.name == name, JobState.locked_by == INSTANCE_ID)
+            .values(**values)
+        )
+        await db.commit()
+        return res.rowcount == 1
+
+async def _heartbeat(name: str, task: asyncio.Task):
+    while True:
+        await asyncio.sleep(JOB_LEASE / 3)
+        try:
+            ok = await _owned_update(name, locked_until=_now() + timedelta(seconds=JOB_LEASE))
+        except Exception as e:
+            log.warning("job %s heartbeat: %s", name, e)
+            continue
+        if not ok:
+            log.error("job %s: lease lost, stopping", name)
+            task.cancel()
+            return
+
+async def run_exclusive(name: str, interval: timedelta, fn: Callable[[int, Checkpoint], Awaitable[None]]):
+    """Выполнить fn(cursor, checkpoint), если задача пора и аренда свободна."""
+    await _ensure_job(name, interval)
+    if not await _acquire(name):
         return
-    db: Session = SessionLocal()
+    async with SessionLocal() as db:
+        cursor = (await db.execute(select(JobState.cursor).where(JobState.name == name))).scalar_one()
+    if cursor:
+        log.info("job %s: resuming from cursor %s", name, cursor)
+
+    async def checkpoint(value: int):
+        if not await _owned_update(name, cursor=value):
+            raise LeaseLost(name)
+
+    started = time.monotonic()
+    work = asyncio.create_task(fn(cursor, checkpoint))
+    beat = asyncio.create_task(_heartbeat(name, work))
     try:
-        users = db.query(User).all()
-        for u in users:
-            tasks = [t for p in u.projects for t in p.tasks]
-            total = len(tasks)
-            done = len([t for t in tasks if t.status == TaskStatus.done])
-            percent = round((done / total) * 100, 2) if total else 0.0
-            text = f"Ваш ежедневный прогресс: {percent}% выполнено. Продолжайте!"
-            async with httpx.AsyncClient() as client:
-                await client.post(f"{TG_API}/bot{BOT_TOKEN}/sendMessage", json={"chat_id": u.tg_id, "text": text})
+        await work
+    except (Exception, asyncio.CancelledError) as e:
+        # курсор остаётся: следующий запуск продолжит с последней пачки
+        log.error("job %s stopped: %r", name, e)
+        JOB_RUNS.labels(name, "failed").inc()
+        await _owned_update(name, locked_by=None, locked_until=None)
+        if isinstance(e, asyncio.CancelledError) and asyncio.current_task().cancelling():
+            raise  # отменили нас (остановка планировщика), а не heartbeat — работу
+        return
     finally:
-        db.close()
+        beat.cancel()
+        JOB_DURATION.labels(name).observe(time.monotonic() - started)
+    JOB_RUNS.labels(name, "done").inc()
+    now = _now()
+    await _owned_update(name, cursor=0, next_run_at=now + interval, last_finished_at=now,
+                        locked_by=None, locked_until=None)
+
+# ---- ежедневные отчёты ----
+def report_text(done: int, total: int) -> str:
+    return f"Ваш ежедневный прогресс: {percent(done, total)}% выполнено. Продолжайте!"
+
+async def send_daily_reports(after_id: int = 0, checkpoint: Checkpoint = None):
+    if not BOT_TOKEN:
+        return
+    started, last_id, sent, failed = time.monotonic(), after_id, 0, 0
+    async with TelegramSender(BOT_TOKEN, TG_API, rate=REPORT_RATE, concurrency=REPORT_CONCURRENCY) as tg:
+        while True:
+            # короткая сессия на пачку: соединение с БД не держим, пока идёт отправка
+            async with SessionLocal() as db:
+                batch = await user_batch(db, last_id, REPORT_BATCH_SIZE)
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            batch_started = time.monotonic()
+            results = await asyncio.gather(*(tg.send_message(tg_id, report_text(done, total)) for _, tg_id, done, total in batch))
+            REPORT_BATCH_DURATION.observe(time.monotonic() - batch_started)
+            ok = sum(results)
+            sent, failed = sent + ok, failed + len(results) - ok
+            REPORT_USERS.labels("sent").inc(ok)
+            REPORT_USERS.labels("failed").inc(len(results) - ok)
+            if checkpoint:
+                await checkpoint(last_id)
+    elapsed = time.monotonic() - started
+    REPORT_DURATION.set(elapsed)
+    REPORT_THROUGHPUT.set(sent / elapsed if elapsed else 0)
+    log.info("daily reports: sent=%d failed=%d in %.1fs (%.1f msg/s)", sent, failed, elapsed, sent / elapsed if elapsed else 0)
+
+async def tick():
+    await run_exclusive("daily_reports", timedelta(hours=24), send_daily_reports)
 
 def start_scheduler():
-    scheduler.add_job(lambda: __import__("asyncio").run(send_daily_reports()), "interval", hours=24, id="daily_reports", replace_existing=True)
-    scheduler.start()
\ No newline at end of file
+    if not SCHEDULER_ENABLED:
+        return
+    scheduler.add_job(tick, "interval", seconds=SCHEDULER_TICK, id="tick", replace_existing=True,
+                      max_instances=1, coalesce=True)
+    scheduler.start()
+
+def stop_scheduler():
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import Annotated, List, Optional
 from .models import TaskStatus
 
 class TaskOut(BaseModel):
@@ -18,6 +18,22 @@ class ProjectOut(BaseModel):
     class Config:
         from_attributes = True
 
+class ProjectsOut(BaseModel):
+    projects: List[ProjectOut]
+
+class AdminUserOut(BaseModel):
+    id: int
+    tg_id: str
+    name: str
+    email: str
+    projects: List[ProjectOut]
+    class Config:
+        from_attributes = True
+
+class AdminUsersPage(BaseModel):
+    users: List[AdminUserOut]
+    next_cursor: Optional[int] = None
+
 class UserRegisterIn(BaseModel):
     tg_id: str
     name: str
@@ -27,10 +43,32 @@ class IdeaIn(BaseModel):
     tg_id: str
     idea: str
 
+class ProjectImportItem(BaseModel):
+    title: str = Field(min_length=1, max_length=255)
+    description: str = ""
+    tasks: List[Annotated[str, Field(min_length=1, max_length=255)]] = []  # = tasks.title String(255)
+
+class ProjectsImportIn(BaseModel):
+    tg_id: str
+    projects: List[ProjectImportItem]
+
+class ImportOut(BaseModel):
+    project_ids: List[int]
+    tasks: int
+
 class UpdateTaskIn(BaseModel):
     task_id: int
     status: TaskStatus
 
+class TaskUpdateResult(BaseModel):
+    task_id: int
+    ok: bool
+    status: Optional[TaskStatus] = None
+    error: Optional[str] = None
+
+class BulkUpdateOut(BaseModel):
+    results: List[TaskUpdateResult]
+
 class AdminLoginIn(BaseModel):
     email: EmailStr
     password: str
@@ -0,0 +1,88 @@
+"""
+Single-flight: на один ключ одновременно выполняется ровно один вызов.
+
+Внутри процесса повторные вызовы ждут тот же asyncio.Task. Между воркерами
+лидер берёт в Redis лок `sf:<key>` с лизом (SET NX PX) и продлевает его,
+пока работает; остальные опрашивают load() до появления результата. Если
+лидер умер, лиз истекает и лок забирает один из ожидающих.
+"""
+import asyncio, contextlib, logging, uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+from .metrics import SINGLEFLIGHT_COALESCED, SINGLEFLIGHT_TAKEOVERS, SINGLEFLIGHT_WAIT_TIMEOUTS
+
+log = logging.getLogger(__name__)
+
+_RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+_RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+
+class SingleFlight:
+    def __init__(self, redis_client, name: str, lease: float = 30.0, wait_timeout: float = 120.0, poll: float = 0.25):
+        self.r = redis_client
+        self.name = name
+        self.lease_ms = int(lease * 1000)
+        self.wait_timeout = wait_timeout
+        self.poll = poll
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], load: Callable[[], Awaitable[Optional[Any]]]):
+        """
+        fn() вычисляет и сохраняет результат (его видит load() других воркеров);
+        load() возвращает готовый результат или None.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            SINGLEFLIGHT_COALESCED.labels(self.name, "local").inc()
+        else:
+            task = asyncio.ensure_future(self._run(key, fn, load))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: отмена одного ожидающего (клиент ушёл) не отменяет вызов для остальных
+        return await asyncio.shield(task)
+
+    async def _run(self, key, fn, load):
+        if not self.r:
+            return await fn()
+        lock, token = f"sf:{key}", uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_timeout
+        waited = False
+        while True:
+            try:
+                acquired = await self.r.set(lock, token, nx=True, px=self.lease_ms)
+            except Exception:
+                log.warning("singleflight: Redis недоступен, выполняю без лока", exc_info=True)
+                return await fn()
+            if acquired:
+                return await self._lead(lock, token, fn, load, waited)
+
+            waited = True
+            if (value := await load()) is not None:
+                SINGLEFLIGHT_COALESCED.labels(self.name, "remote").inc()
+                return value
+            if loop.time() >= deadline:
+                SINGLEFLIGHT_WAIT_TIMEOUTS.labels(self.name).inc()
+                return await fn()
+            await asyncio.sleep(self.poll)
+
+    async def _lead(self, lock, token, fn, load, waited: bool):
+        heartbeat = asyncio.ensure_future(self._renew(lock, token))
+        try:
+            # предыдущий лидер мог успеть сохранить результат между нашим load() и SET NX
+            if (value := await load()) is not None:
+                if waited:
+                    SINGLEFLIGHT_COALESCED.labels(self.name, "remote").inc()
+                return value
+            if waited:
+                SINGLEFLIGHT_TAKEOVERS.labels(self.name).inc()
+            return await fn()
+        finally:
+            heartbeat.cancel()
+            with contextlib.suppress(Exception):
+                await self.r.eval(_RELEASE, 1, lock, token)
+
+    async def _renew(self, lock, token):
+        with contextlib.suppress(asyncio.CancelledError):
+            while True:
+                await asyncio.sleep(self.lease_ms / 3000)
+                with contextlib.suppress(Exception):
+                    await self.r.eval(_RENEW, 1, lock, token, self.lease_ms)
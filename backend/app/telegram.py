@@ -0,0 +1,96 @@
+"""
+Отправка сообщений через Telegram Bot API с учётом лимитов.
+
+Один пул соединений на всю рассылку, ограничение параллелизма,
+token bucket на глобальный лимит (~30 msg/s у Telegram), минимальный
+интервал на чат и обработка 429 по retry_after.
+"""
+import asyncio, time, logging
+from typing import Dict, Optional
+import httpx
+from .metrics import TG_SENT, TG_RETRY_AFTER
+
+log = logging.getLogger(__name__)
+
+class TokenBucket:
+    """burst — сколько можно отправить разом после простоя; старт с одного токена, чтобы
+    первая секунда не давала burst + rate сообщений."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate / 10)
+        self.tokens = min(1.0, self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def _retry_after(r: httpx.Response) -> float:
+    """retry_after из ответа 429; тело не от Telegram (прокси, балансировщик) — 1с."""
+    try:
+        return float((r.json().get("parameters") or {}).get("retry_after", 1))
+    except (ValueError, TypeError, AttributeError):
+        return 1.0
+
+class TelegramSender:
+    def __init__(self, token: str, api_base: str, rate: float = 25, per_chat_interval: float = 1.0,
+                 concurrency: int = 20, max_retries: int = 3):
+        self.token = token
+        self.client = httpx.AsyncClient(
+            base_url=api_base,
+            timeout=httpx.Timeout(15.0, connect=5.0),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+        self.bucket = TokenBucket(rate)
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self._sem = asyncio.Semaphore(concurrency)
+        self._chat_next: Dict[str, float] = {}
+        self._paused_until = 0.0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    async def _wait_turn(self, chat_id: str):
+        now = time.monotonic()
+        delay = max(self._paused_until, self._chat_next.get(chat_id, 0.0)) - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._chat_next[chat_id] = time.monotonic() + self.per_chat_interval
+        await self.bucket.acquire()
+
+    async def send_message(self, chat_id: str, text: str) -> bool:
+        async with self._sem:
+            for attempt in range(self.max_retries + 1):
+                await self._wait_turn(chat_id)
+                try:
+                    r = await self.client.post(f"/bot{self.token}/sendMessage", json={"chat_id": chat_id, "text": text})
+                except httpx.TransportError as e:
+                    log.warning("sendMessage %s: %s", chat_id, e)
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                if r.status_code == 429:
+                    retry_after = _retry_after(r)
+                    TG_RETRY_AFTER.inc()
+                    # 429 у Telegram — на весь бот: притормаживаем всех отправителей
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                    continue
+                if r.status_code >= 500:
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                TG_SENT.labels("ok" if r.is_success else "rejected").inc()
+                return r.is_success
+            TG_SENT.labels("failed").inc()
+            return False
@@ -0,0 +1,59 @@
+"""
+Смена статуса 1000 задач: по одной через PATCH /tasks/{id} против одного PATCH /tasks.
+
+    cd backend && python -m bench.bulk_update [--tasks 1000]
+"""
+import argparse, asyncio, json, time
+from sqlalchemy import select
+from bench.common import reset_db, seed_user, asgi_client, QueryCounter
+
+from fastapi import FastAPI
+from app.db import SessionLocal
+from app.models import Task
+from app.routers import tasks
+from app import progress
+
+
+async def run(args):
+    await reset_db()
+    app = FastAPI()
+    app.include_router(tasks.router)
+
+    per_project = 6
+    await seed_user("bench-bulk", -(-args.tasks // per_project), per_project)
+    async with SessionLocal() as db:
+        await progress.rebuild(db)
+        ids = (await db.scalars(select(Task.id).order_by(Task.id).limit(args.tasks))).all()
+
+    async with asgi_client(app) as client:
+        with QueryCounter() as qc:
+            t0 = time.perf_counter()
+            for tid in ids:
+                (await client.patch(f"/tasks/{tid}", params={"status": "in_progress"})).raise_for_status()
+            single_ms = (time.perf_counter() - t0) * 1000
+        print(json.dumps({"bench": "bulk_update", "mode": "single", "tasks": len(ids), "requests": len(ids),
+                          "queries": qc.count, "total_ms": round(single_ms, 1)}))
+
+        with QueryCounter() as qc:
+            t0 = time.perf_counter()
+            r = await client.patch("/tasks", json=[{"task_id": tid, "status": "done"} for tid in ids])
+            r.raise_for_status()
+            bulk_ms = (time.perf_counter() - t0) * 1000
+        assert all(i["ok"] for i in r.json()["results"])
+        print(json.dumps({"bench": "bulk_update", "mode": "bulk", "tasks": len(ids), "requests": 1,
+                          "queries": qc.count, "total_ms": round(bulk_ms, 1),
+                          "speedup": round(single_ms / bulk_ms, 1)}))
+
+    async with SessionLocal() as db:
+        problems = await progress.check(db)
+    assert not problems, problems[:5]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tasks", type=int, default=1000)
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Общие утилиты для бенчмарков: БД по умолчанию, сидинг, подсчёт запросов."""
+import os, time, statistics, contextlib
+from typing import List
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./bench.db")
+
+import httpx
+from sqlalchemy import event, insert
+from app.db import Base, engine, SessionLocal
+from app.models import User, Project, Task
+
+
+async def reset_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def seed_user(tg_id: str, n_projects: int, tasks_per_project: int = 6) -> int:
+    async with SessionLocal() as db:
+        user = User(tg_id=tg_id, name=f"bench {tg_id}", email=f"{tg_id}@bench.local")
+        db.add(user)
+        await db.flush()
+        project_ids = (await db.scalars(
+            insert(Project).returning(Project.id),
+            [{"user_id": user.id, "title": f"Проект {i}", "description": "bench"} for i in range(n_projects)],
+        )).all() if n_projects else []
+        if project_ids and tasks_per_project:
+            await db.execute(insert(Task), [
+                {"project_id": pid, "title": f"Задача {j}", "order": j}
+                for pid in project_ids for j in range(tasks_per_project)
+            ])
+        await db.commit()
+        return user.id
+
+
+async def seed_users(prefix: str, n_users: int, n_projects: int = 1, tasks_per_project: int = 6,
+                     batch: int = 2000) -> List[str]:
+    """Много пользователей пачками (tg_id = prefix + номер); счётчики — progress.rebuild отдельно."""
+    tg_ids = [f"{prefix}{i}" for i in range(n_users)]
+    for start in range(0, n_users, batch):
+        chunk = tg_ids[start:start + batch]
+        async with SessionLocal() as db:
+            user_ids = (await db.scalars(
+                insert(User).returning(User.id, sort_by_parameter_order=True),
+                [{"tg_id": t, "name": f"bench {t}", "email": f"{t}@bench.local"} for t in chunk],
+            )).all()
+            project_ids = (await db.scalars(
+                insert(Project).returning(Project.id),
+                [{"user_id": uid, "title": f"Проект {j}", "description": "bench"}
+                 for uid in user_ids for j in range(n_projects)],
+            )).all() if n_projects else []
+            if project_ids and tasks_per_project:
+                await db.execute(insert(Task), [
+                    {"project_id": pid, "title": f"Задача {j}", "order": j}
+                    for pid in project_ids for j in range(tasks_per_project)
+                ])
+            await db.commit()
+    return tg_ids
+
+
+def asgi_client(app) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+
+class QueryCounter:
+    """Считает SQL-запросы, выполненные через engine внутри with-блока."""
+
+    def __init__(self, eng=engine):
+        self.engine = eng.sync_engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+@contextlib.contextmanager
+def timer(samples: List[float]):
+    t0 = time.perf_counter()
+    yield
+    samples.append((time.perf_counter() - t0) * 1000)
+
+
+def summary(samples: List[float]) -> dict:
+    ordered = sorted(samples)
+    p95 = ordered[max(0, int(round(len(ordered) * 0.95)) - 1)]
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(p95, 3),
+    }
@@ -0,0 +1,108 @@
+"""
+EXPLAIN горячих запросов на объёме (по умолчанию 1M задач): проверяет, что
+используются индексы, а не полный скан. Exit 1 при регрессии — годится для CI.
+
+    cd backend && python -m bench.explain_indexes [--tasks 1000000]
+    DATABASE_URL=postgresql://... python -m bench.explain_indexes
+
+Схема — из моделей (create_all); соответствие миграциям проверяет `alembic check`.
+"""
+import argparse, asyncio, json, re, sys, time
+from sqlalchemy import select, func, insert, text
+from bench.common import reset_db
+
+from app.db import engine
+from app.models import User, Project, Task, TaskStatus
+
+PROJECTS_PER_USER, TASKS_PER_PROJECT, CHUNK = 10, 6, 50_000
+
+# имя запроса → (запрос, индексы, хотя бы один из которых должен быть в плане)
+def hot_queries():
+    pids = list(range(1000, 1010))
+    return {
+        "projects_by_user": (select(Project.id, Project.title).where(Project.user_id == 500), ["ix_projects_user_id"]),
+        "tasks_of_projects": (select(Task).where(Task.project_id.in_(pids)), ["ix_tasks_project_status", "ix_tasks_project_order"]),
+        "tasks_ordered": (select(Task).where(Task.project_id == 1000).order_by(Task.order), ["ix_tasks_project_order"]),
+        "done_count": (
+            select(func.count()).select_from(Task).where(Task.project_id == 1000, Task.status == TaskStatus.done),
+            ["ix_tasks_project_status"],
+        ),
+        "user_progress": (
+            select(User.id, func.count(Task.id))
+            .outerjoin(Project, Project.user_id == User.id)
+            .outerjoin(Task, Task.project_id == Project.id)
+            .where(User.tg_id == "u500")
+            .group_by(User.id),
+            ["ix_projects_user_id"],
+        ),
+    }
+
+FULL_SCAN = {
+    "sqlite": re.compile(r"\bSCAN (tasks|projects|users)\b"),
+    "postgresql": re.compile(r"Seq Scan on (tasks|projects|users)\b"),
+}
+
+
+async def seed(n_tasks: int):
+    n_projects = -(-n_tasks // TASKS_PER_PROJECT)
+    n_users = -(-n_projects // PROJECTS_PER_USER)
+    async with engine.begin() as conn:
+        for lo in range(0, n_users, CHUNK):
+            await conn.execute(insert(User), [
+                {"id": i + 1, "tg_id": f"u{i + 1}", "name": "bench", "email": "b@bench.local"}
+                for i in range(lo, min(n_users, lo + CHUNK))
+            ])
+        for lo in range(0, n_projects, CHUNK):
+            await conn.execute(insert(Project), [
+                {"id": i + 1, "user_id": i // PROJECTS_PER_USER + 1, "title": "p", "description": ""}
+                for i in range(lo, min(n_projects, lo + CHUNK))
+            ])
+        statuses = list(TaskStatus)
+        for lo in range(0, n_tasks, CHUNK):
+            await conn.execute(insert(Task), [
+                {"project_id": i // TASKS_PER_PROJECT + 1, "title": "t", "order": i % TASKS_PER_PROJECT,
+                 "status": statuses[i % len(statuses)]}
+                for i in range(lo, min(n_tasks, lo + CHUNK))
+            ])
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE"))
+
+
+async def explain(conn, stmt) -> str:
+    dialect = conn.dialect.name
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if dialect == "sqlite":
+        rows = (await conn.execute(text("EXPLAIN QUERY PLAN " + sql))).all()
+        return "\n".join(r[-1] for r in rows)
+    rows = (await conn.execute(text("EXPLAIN " + sql))).all()
+    return "\n".join(r[0] for r in rows)
+
+
+async def run(args) -> int:
+    if not args.no_seed:
+        await reset_db()
+        t0 = time.perf_counter()
+        await seed(args.tasks)
+        print(json.dumps({"seeded_tasks": args.tasks, "seconds": round(time.perf_counter() - t0, 1)}))
+
+    failed = 0
+    async with engine.connect() as conn:
+        full_scan = FULL_SCAN[conn.dialect.name]
+        for name, (stmt, indexes) in hot_queries().items():
+            plan = await explain(conn, stmt)
+            ok = any(ix in plan for ix in indexes) and not full_scan.search(plan)
+            failed += not ok
+            print(json.dumps({"query": name, "ok": ok, "plan": plan.splitlines()}, ensure_ascii=False))
+    await engine.dispose()
+    return 1 if failed else 0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tasks", type=int, default=1_000_000)
+    ap.add_argument("--no-seed", action="store_true", help="проверить планы на уже заполненной базе")
+    sys.exit(asyncio.run(run(ap.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Локальные подмены внешних сервисов для бенчмарков: OpenAI-совместимый LLM и Telegram Bot API.
+
+Оба — обычные ASGI-приложения, поднимаются через serve() на 127.0.0.1 и
+считают, что к ним пришло (stats), чтобы сценарий мог сверить результат.
+"""
+import json, time, random, asyncio, contextlib
+from collections import defaultdict
+from typing import Dict, Optional
+from urllib.parse import parse_qsl
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+
+class FakeLLM:
+    """
+    /v1/chat/completions в духе llama.cpp.
+      • slots одновременных генераций, остальные ждут; id_slot занимает конкретный слот;
+      • prefill: ttft + (токены промпта вне кэша) / prompt_tps; с cache_prompt общий
+        префикс с прошлым промптом этого слота не пересчитывается;
+      • затем tokens_per_s токенов в секунду; токен ≈ 4 символа;
+      • без response_format/grammar модель после JSON ещё trailer токенов «болтает»;
+      • stall — доля запросов, которые перед ответом «подвисают» на stall_s (хвост латентности);
+        down = True — сервер лежит и отвечает 503.
+    Ответ — валидный JSON роадмапа. faults — доля «плохих» ответов: поровну текст
+    вокруг JSON и ответ, оборванный на середине. В последнем чанке — usage
+    (с prompt_tokens_details.cached_tokens) и timings, как у llama.cpp.
+    """
+
+    def __init__(self, ttft: float = 0.3, tokens_per_s: float = 50, slots: int = 4, faults: float = 0.0,
+                 prompt_tps: float = 0.0, trailer: int = 0, stall: float = 0.0, stall_s: float = 2.0, seed: int = 42):
+        self.ttft = ttft
+        self.tokens_per_s = tokens_per_s
+        self.prompt_tps = prompt_tps
+        self.trailer = trailer
+        self.faults = faults
+        self.stall, self.stall_s = stall, stall_s
+        self.down = False
+        self.rng = random.Random(seed)
+        self._busy = [False] * slots
+        self._cache = [""] * slots  # последний промпт слота (KV-кэш)
+        self._free = asyncio.Condition()
+        self.stats = {"requests": 0, "unavailable": 0, "stalled": 0, "closed": 0, "active": 0, "max_active": 0, "completion_tokens": 0,
+                      "prompt_tokens": 0, "prompt_cached": 0, "prompt_seconds": 0.0}
+        self.app = Starlette(routes=[Route("/v1/chat/completions", self.completions, methods=["POST"])])
+
+    @staticmethod
+    def answer(prompt: str) -> str:
+        idea = prompt.rsplit("Идея:", 1)[-1].strip()[:60]
+        return json.dumps({
+            "description": f"Сервис «{idea}»: быстрый MVP для проверки спроса.",
+            "tasks": [f"Шаг {i + 1} для «{idea}»" for i in range(6)],
+        }, ensure_ascii=False)
+
+    def _pick(self, want: Optional[int]) -> Optional[int]:
+        if want is not None and 0 <= want < len(self._busy):
+            return None if self._busy[want] else want
+        return next((i for i, busy in enumerate(self._busy) if not busy), None)
+
+    async def completions(self, request: Request):
+        body = await request.json()
+        if self.down:
+            self.stats["unavailable"] += 1
+            return JSONResponse({"error": {"message": "Loading model", "type": "unavailable_error"}}, status_code=503)
+        prompt = "\n".join(m["content"] for m in body["messages"])
+        text = self.answer(body["messages"][-1]["content"])
+        if self.rng.random() < self.faults:
+            text = f"Конечно! Вот план:\n{text}\nУдачи!" if self.rng.random() < 0.5 else text[:len(text) * 2 // 3]
+        if self.trailer and not (body.get("response_format") or body.get("grammar")):
+            text += "\n\nЕсли нужно, могу расписать каждую задачу подробнее." * (self.trailer * 4 // 50 + 1)
+            text = text[:len(text) - len(text) % 4]
+        pieces = [text[i:i + 4] for i in range(0, len(text), 4)]
+        pieces = pieces[:body.get("max_tokens") or len(pieces)]
+        self.stats["requests"] += 1
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(pieces)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        timings: Dict[str, float] = {}
+        stall = self.stall_s if self.rng.random() < self.stall else 0.0
+        self.stats["stalled"] += bool(stall)
+
+        async def generate():
+            async with self._free:
+                await self._free.wait_for(lambda: self._pick(body.get("id_slot")) is not None)
+                slot = self._pick(body.get("id_slot"))
+                self._busy[slot] = True
+            self.stats["active"] += 1
+            self.stats["max_active"] = max(self.stats["max_active"], self.stats["active"])
+            try:
+                cached = 0
+                if body.get("cache_prompt"):
+                    prev = self._cache[slot]
+                    while cached < min(len(prev), len(prompt)) and prev[cached] == prompt[cached]:
+                        cached += 1
+                self._cache[slot] = prompt
+                cached_tokens = cached // 4
+                uncached = usage["prompt_tokens"] - cached_tokens
+                prefill = uncached / self.prompt_tps if self.prompt_tps else 0.0
+                usage["prompt_tokens_details"] = {"cached_tokens": cached_tokens}
+                timings.update(prompt_n=uncached, prompt_ms=round(prefill * 1000, 2))
+                self.stats["prompt_tokens"] += usage["prompt_tokens"]
+                self.stats["prompt_cached"] += cached_tokens
+                self.stats["prompt_seconds"] += prefill
+                await asyncio.sleep(self.ttft + prefill + stall)
+                for piece in pieces:
+                    yield piece
+                    self.stats["completion_tokens"] += 1
+                    await asyncio.sleep(1 / self.tokens_per_s)
+            except (asyncio.CancelledError, GeneratorExit):  # клиент закрыл стрим
+                self.stats["closed"] += 1
+                raise
+            finally:
+                self.stats["active"] -= 1
+                async with self._free:
+                    self._busy[slot] = False
+                    self._free.notify_all()
+
+        base = {"id": "bench", "created": int(time.time()), "model": body.get("model", "bench")}
+        if not body.get("stream"):
+            content = "".join([p async for p in generate()])
+            return JSONResponse({**base, "object": "chat.completion", "usage": usage, "timings": timings, "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]})
+
+        async def sse():
+            chunk = {**base, "object": "chat.completion.chunk"}
+            async for piece in generate():
+                yield "data: " + json.dumps({**chunk, "choices": [
+                    {"index": 0, "delta": {"content": piece}, "finish_reason": None}]}) + "\n\n"
+            yield "data: " + json.dumps({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}) + "\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield "data: " + json.dumps({**chunk, "choices": [], "usage": usage, "timings": timings}) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(sse(), media_type="text/event-stream")
+
+
+class FakeTelegram:
+    """
+    Bot API: отвечает на любой метод, считает вызовы и сообщения по чатам.
+    limit > 0 — не больше limit вызовов в секунду на весь бот, сверх — 429 с retry_after.
+    """
+
+    def __init__(self, limit: float = 0):
+        self.limit = limit
+        self.window, self.window_calls = 0, 0
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.per_chat: Dict[int, int] = defaultdict(int)
+        self.rejected = 0  # ответов 429
+        self.message_id = 0
+        self.app = Starlette(routes=[Route("/bot{token}/{method}", self.handle, methods=["POST", "GET"])])
+
+    async def handle(self, request: Request):
+        method = request.path_params["method"]
+        raw = await request.body()
+        # aiogram без файлов шлёт urlencoded-форму, backend — JSON
+        data = json.loads(raw) if request.headers.get("content-type", "").startswith("application/json") \
+            else dict(parse_qsl(raw.decode()))
+        if self.limit:
+            now = int(time.monotonic())
+            if now != self.window:
+                self.window, self.window_calls = now, 0
+            self.window_calls += 1
+            if self.window_calls > self.limit:
+                self.rejected += 1
+                return JSONResponse({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                     "parameters": {"retry_after": 1}}, status_code=429)
+        self.calls[method] += 1
+        if method == "getMe":
+            return JSONResponse({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}})
+        if method in ("sendMessage", "editMessageText"):
+            if not str(data.get("chat_id", "")).lstrip("-").isdigit():
+                return JSONResponse({"ok": False, "error_code": 400, "description": "Bad Request: chat not found"}, status_code=400)
+            chat_id = int(data["chat_id"])
+            self.per_chat[chat_id] += 1
+            self.message_id += 1
+            return JSONResponse({"ok": True, "result": {
+                "message_id": int(data.get("message_id") or self.message_id), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "text": data.get("text", ""),
+            }})
+        return JSONResponse({"ok": True, "result": True})
+
+
+@contextlib.asynccontextmanager
+async def serve(app, port: int, lifespan: str = "off"):
+    """ASGI-приложение на 127.0.0.1:port в этом же event loop; отдаёт базовый URL."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan=lifespan))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+            raise RuntimeError(f"127.0.0.1:{port} не поднялся")
+        await asyncio.sleep(0.05)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await task
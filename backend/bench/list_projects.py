@@ -0,0 +1,60 @@
+"""
+GET /users/{tg_id}/projects: число SQL-запросов и p95 для 1, 50 и 500 проектов.
+
+    cd backend && python -m bench.list_projects [--requests 200] [--no-cache]
+
+Каждый размер меряется дважды: cache=off — кэш тела ответа выключен, каждый запрос
+идёт в БД и сериализует проекты заново; cache=on — как в проде, после первого
+запроса тело берётся из TwoTierCache. --no-cache — только первый прогон.
+"""
+import argparse, asyncio, json
+from bench.common import reset_db, seed_user, asgi_client, QueryCounter, timer, summary
+
+from fastapi import FastAPI
+from app.cache import TwoTierCache
+from app.routers import users
+
+
+async def run(args):
+    await reset_db()
+    app = FastAPI()
+    app.include_router(users.router)
+
+    cached = users._cache
+    # без Redis и с нулевым LRU: set ничего не сохраняет, get всегда промах
+    off = TwoTierCache("projects_bench", None, local_size=0, local_ttl=0, ttl=0, negative_ttl=0)
+    modes = [("off", off)] + ([] if args.no_cache else [("on", cached)])
+
+    async with asgi_client(app) as client:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            tg_id = f"bench-{size}"
+            await seed_user(tg_id, size)
+
+            for mode, cache in modes:
+                users._cache = cache
+                (await client.get(f"/users/{tg_id}/projects")).raise_for_status()  # в режиме on — прогрев кэша
+                with QueryCounter() as qc:
+                    r = await client.get(f"/users/{tg_id}/projects")
+                    r.raise_for_status()
+                assert len(r.json()["projects"]) == size
+
+                samples = []
+                for _ in range(args.requests):
+                    with timer(samples):
+                        (await client.get(f"/users/{tg_id}/projects")).raise_for_status()
+
+                print(json.dumps({"bench": "list_projects", "projects": size, "cache": mode, "queries": qc.count,
+                                  **summary(samples)}))
+    users._cache = cached
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--sizes", default="1,50,500")
+    ap.add_argument("--no-cache", action="store_true", help="только прогон с выключенным кэшем ответа")
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Роутер LLM-серверов (app.llm_router) против двух фейковых llama.cpp (bench.fakes.FakeLLM).
+
+    cd backend && python -m bench.llm_router [--requests 200 --stall 0.05 --stall-s 2]
+
+  tail      у каждого сервера stall доля ответов «подвисает» на stall_s: хвост латентности
+            без хеджа и с хеджем по p90 (LLM_HEDGE=1);
+  failover  первый сервер отвечает 503: генерации не теряются, а предохранитель
+            выключает сервер после LLM_CB_FAILURES ошибок.
+Перед каждым прогоном — прогрев (warmup генераций, не в статистике): хеджу нужны замеры для p90.
+"""
+import os, json, time, asyncio, argparse
+
+from prometheus_client import REGISTRY
+
+PORTS = (18181, 18182)
+
+
+def _counter(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+async def run(args):
+    from bench.common import summary
+    from bench.fakes import FakeLLM, serve
+    from app import ai_service
+    from app.llm_router import Backend, Router
+
+    fakes = [FakeLLM(ttft=args.ttft, tokens_per_s=args.tps, slots=args.slots, stall=args.stall, stall_s=args.stall_s, seed=i)
+             for i in range(len(PORTS))]
+    configs = [
+        ("tail_no_hedge", dict(hedge=False, down=False)),
+        ("tail_hedge", dict(hedge=True, down=False)),
+        ("failover", dict(hedge=True, down=True)),
+    ]
+    async with serve(fakes[0].app, PORTS[0]), serve(fakes[1].app, PORTS[1]):
+        for name, cfg in configs:
+            backends = [Backend(f"llm{i}", f"http://127.0.0.1:{port}/v1", "bench", slots=args.slots)
+                        for i, port in enumerate(PORTS)]
+            ai_service.router = Router(backends, hedge=cfg["hedge"])
+            gate = asyncio.Semaphore(args.concurrency)
+
+            async def batch(n: int, tag: str):
+                samples, failed = [], 0
+
+                async def one(i: int):
+                    nonlocal failed
+                    async with gate:
+                        t0 = time.perf_counter()
+                        try:
+                            await ai_service._llm_generate(f"{tag}: сервис №{i}")
+                        except Exception:
+                            failed += 1
+                            return
+                        samples.append((time.perf_counter() - t0) * 1000)
+
+                await asyncio.gather(*(one(i) for i in range(n)))
+                return samples, failed
+
+            fakes[0].down = False
+            await batch(args.warmup, f"{name}-warmup")
+            fakes[0].down = cfg["down"]
+            before = [dict(f.stats) for f in fakes]
+            hedges = {r: _counter("llm_hedges_total", result=r) for r in ("fired", "won")}
+            failovers = _counter("llm_failovers_total")
+            t0 = time.perf_counter()
+            samples, failed = await batch(args.requests, name)
+            elapsed = time.perf_counter() - t0
+            per_backend = {
+                b.name: {k: f.stats[k] - was[k] for k in ("requests", "unavailable", "stalled", "closed")}
+                | {"breaker": b.breaker.state}
+                for b, f, was in zip(backends, fakes, before)
+            }
+            print(json.dumps({
+                "bench": "llm_router", "config": name, "requests": args.requests, "failed": failed,
+                "seconds": round(elapsed, 2),
+                "hedges_fired": int(_counter("llm_hedges_total", result="fired") - hedges["fired"]),
+                "hedges_won": int(_counter("llm_hedges_total", result="won") - hedges["won"]),
+                "failovers": int(_counter("llm_failovers_total") - failovers),
+                "backends": per_backend,
+                **summary(samples),
+            }, ensure_ascii=False), flush=True)
+            await ai_service.router.aclose()
+        fakes[0].down = False
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--warmup", type=int, default=40)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--slots", type=int, default=4, help="слотов на каждом сервере")
+    ap.add_argument("--ttft", type=float, default=0.05)
+    ap.add_argument("--tps", type=float, default=400, help="скорость генерации, токенов/с на слот")
+    ap.add_argument("--stall", type=float, default=0.05, help="доля «подвисших» ответов (хедж по p90 спасает, пока она меньше 10%%)")
+    ap.add_argument("--stall-s", type=float, default=2.0)
+    args = ap.parse_args()
+    # до импорта app.ai_service: настройки читаются при импорте
+    os.environ.update(AI_PROVIDER="oss", OSS_BASE_URL=f"http://127.0.0.1:{PORTS[0]}/v1", LLM_RETRIES="0")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
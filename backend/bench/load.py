@@ -0,0 +1,78 @@
+"""
+Нагрузка «N ботов одновременно»: каждый клиент крутит навигацию бота
+(список проектов → отчёт → смена статуса) и мы считаем RPS и p95.
+
+    cd backend && python -m bench.load --clients 200 --duration 20
+    python -m bench.load --base-url http://localhost:8000   # против запущенного uvicorn
+
+Для сравнения sync/async прогоните один и тот же сценарий на обеих версиях
+бэкенда с одинаковыми --clients/--duration.
+"""
+import argparse, asyncio, json, random, time
+import httpx
+from bench.common import reset_db, seed_user, asgi_client, summary
+
+
+async def bot_client(client: httpx.AsyncClient, tg_id: str, task_ids, deadline: float, samples, errors):
+    statuses = ("pending", "in_progress", "done")
+    while time.perf_counter() < deadline:
+        for method, url, params in (
+            ("GET", f"/users/{tg_id}/projects", None),
+            ("GET", f"/ai/report/{tg_id}", None),
+            ("PATCH", f"/tasks/{random.choice(task_ids)}", {"status": random.choice(statuses)}),
+        ):
+            t0 = time.perf_counter()
+            try:
+                r = await client.request(method, url, params=params)
+                r.raise_for_status()
+            except Exception:
+                errors.append(url)
+                continue
+            samples.append((time.perf_counter() - t0) * 1000)
+
+
+async def run(args):
+    n_users = min(args.clients, args.users)
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=30, limits=httpx.Limits(max_connections=args.clients))
+    else:
+        from app.main import app
+        from app.progress import rebuild
+        from app.db import SessionLocal
+        await reset_db()
+        for i in range(n_users):
+            await seed_user(f"load-{i}", args.projects)
+        async with SessionLocal() as db:
+            await rebuild(db)
+        client = asgi_client(app)
+
+    async with client:
+        data = (await client.get("/users/load-0/projects")).json()
+        task_ids = [t["id"] for p in data["projects"] for t in p["tasks"]]
+        samples, errors = [], []
+        t0 = time.perf_counter()
+        deadline = t0 + args.duration
+        await asyncio.gather(*(
+            bot_client(client, f"load-{i % n_users}", task_ids, deadline, samples, errors)
+            for i in range(args.clients)
+        ))
+        elapsed = time.perf_counter() - t0
+
+    print(json.dumps({
+        "bench": "load", "clients": args.clients, "duration_s": round(elapsed, 2),
+        "rps": round(len(samples) / elapsed, 1), "errors": len(errors), **summary(samples),
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clients", type=int, default=200)
+    ap.add_argument("--duration", type=float, default=20)
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--projects", type=int, default=5)
+    ap.add_argument("--base-url")
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
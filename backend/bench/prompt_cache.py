@@ -0,0 +1,90 @@
+"""
+Кэш префикса промпта и бюджет токенов: сколько prompt eval и токенов ответа экономит
+каждая настройка генерации против фейкового llama.cpp (bench.fakes.FakeLLM).
+
+    cd backend && python -m bench.prompt_cache [--requests 80 --concurrency 8 --prompt-tps 150]
+
+Конфигурации накапливаются: baseline → + cache_prompt/id_slot → + ранняя остановка
+→ + max_tokens по наблюдаемым ответам. Вывод ограничения (json_schema) по умолчанию
+выключен: с ним модель и так останавливается на `}`, и ранняя остановка не видна.
+"""
+import os, sys, json, time, asyncio, argparse
+
+LLM_PORT = 18180
+
+
+async def run(args):
+    from bench.common import summary
+    from bench.fakes import FakeLLM, serve
+    from app import ai_service
+
+    fake = FakeLLM(ttft=args.ttft, tokens_per_s=args.tps, slots=args.slots, prompt_tps=args.prompt_tps, trailer=args.trailer)
+    configs = [
+        ("baseline", dict(LLM_PIN_SLOTS=False, LLM_EARLY_STOP=False, adaptive=False)),
+        ("prefix_cache", dict(LLM_PIN_SLOTS=True, LLM_EARLY_STOP=False, adaptive=False)),
+        ("early_stop", dict(LLM_PIN_SLOTS=True, LLM_EARLY_STOP=True, adaptive=False)),
+        ("adaptive_budget", dict(LLM_PIN_SLOTS=True, LLM_EARLY_STOP=True, adaptive=True)),
+    ]
+    async with serve(fake.app, LLM_PORT):
+        for name, cfg in configs:
+            ai_service.LLM_PIN_SLOTS = cfg["LLM_PIN_SLOTS"]
+            ai_service.LLM_EARLY_STOP = cfg["LLM_EARLY_STOP"]
+            ceiling = ai_service.LLM_MAX_TOKENS
+            ai_service.budget = ai_service.TokenBudget(
+                ceiling, ai_service.LLM_MIN_TOKENS, ai_service.LLM_TOKENS_HEADROOM,
+                min_samples=10 if cfg["adaptive"] else sys.maxsize,
+            )
+            fake._cache = [""] * args.slots
+            before = dict(fake.stats)
+            samples, failed = [], 0
+            gate = asyncio.Semaphore(args.concurrency)
+
+            async def one(i: int):
+                nonlocal failed
+                async with gate:
+                    t0 = time.perf_counter()
+                    try:
+                        await ai_service.queue.submit(
+                            f"user-{i}", lambda _slot: ai_service._llm_generate(f"{name}: сервис №{i} для учёта задач"),
+                        )
+                    except Exception:
+                        failed += 1
+                        return
+                    samples.append((time.perf_counter() - t0) * 1000)
+
+            t0 = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.requests)))
+            elapsed = time.perf_counter() - t0
+            delta = {k: fake.stats[k] - before[k] for k in ("requests", "prompt_tokens", "prompt_cached", "prompt_seconds", "completion_tokens")}
+            print(json.dumps({
+                "bench": "prompt_cache", "config": name, "requests": delta["requests"], "failed": failed,
+                "seconds": round(elapsed, 2),
+                "prompt_tokens": delta["prompt_tokens"], "prompt_cached": delta["prompt_cached"],
+                "prompt_eval_ms_per_request": round(delta["prompt_seconds"] / max(1, delta["requests"]) * 1000, 1),
+                "completion_tokens_per_request": round(delta["completion_tokens"] / max(1, delta["requests"]), 1),
+                "max_tokens": ai_service.budget.current(),
+                **summary(samples),
+            }), flush=True)
+    await ai_service.aclose()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=80)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--slots", type=int, default=4)
+    ap.add_argument("--ttft", type=float, default=0.05, help="накладные до prefill, с")
+    ap.add_argument("--prompt-tps", type=float, default=150, help="скорость prompt eval, токенов/с")
+    ap.add_argument("--tps", type=float, default=200, help="скорость генерации, токенов/с на слот")
+    ap.add_argument("--trailer", type=int, default=40, help="токенов «болтовни» после JSON без ограничения вывода")
+    ap.add_argument("--output-mode", default="off", help="LLM_OUTPUT_MODE на время прогона")
+    args = ap.parse_args()
+    # до импорта app.ai_service: настройки читаются при импорте
+    os.environ.update(AI_PROVIDER="oss", OSS_BASE_URL=f"http://127.0.0.1:{LLM_PORT}/v1",
+                      LLM_PARALLEL=str(args.slots), LLM_OUTPUT_MODE=args.output_mode,
+                      LLM_QUEUE_MAX=str(args.requests), LLM_QUEUE_PER_USER="1")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Сквозной прогон: FastAPI-приложение целиком (uvicorn на 127.0.0.1), фейковый
+LLM вместо llama.cpp и фейковый Telegram Bot API для scheduler.py и bot.py.
+
+    cd backend && python -m bench.suite --out results.json
+    python -m bench.suite --scenarios idea_burst,admin_export --quick
+    python -m bench.suite --out new.json --compare results.json   # разница с прошлым прогоном
+
+Сценарии:
+  idea_burst        N идей разом через POST /projects/idea/jobs + опрос до done
+  navigation_storm  чаты бота гоняют upd:* колбэки (проекты → задача → статус → назад)
+  daily_report      scheduler.send_daily_reports по всем пользователям (100k по умолчанию)
+  admin_export      потоковая выгрузка /admin/users/export (NDJSON)
+
+БД — DATABASE_URL (по умолчанию sqlite ./bench.db; для Postgres укажите URL
+локальной базы), схема пересоздаётся. Для navigation_storm нужен aiogram
+(зависимости бота): без него сценарий помечается skipped. Всё крутится в одном
+процессе, поэтому цифры — для сравнения коммитов между собой на одной машине,
+а не абсолютная ёмкость продакшна.
+
+Результат: по JSON-строке на сценарий и, с --out, файл со всеми сценариями,
+коммитом и параметрами. --compare печатает относительную разницу числовых полей.
+"""
+import os, sys, json, time, random, asyncio, argparse, resource, subprocess
+from typing import Dict
+
+from prometheus_client import REGISTRY
+from bench.common import reset_db, seed_users, summary
+
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "bot")
+ADMIN_EMAIL = "bench@bench.local"
+SCENARIOS = ("idea_burst", "navigation_storm", "daily_report", "admin_export")
+PARSE_RESULTS = ("ok", "repaired", "invalid_json", "truncated", "bad_shape")
+
+
+def _counter(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def configure(args):
+    """Окружение до импорта app.*: настройки читаются модулями при импорте."""
+    os.environ.update({
+        "AI_PROVIDER": "oss",
+        "OSS_BASE_URL": f"http://127.0.0.1:{args.llm_port}/v1",
+        "TELEGRAM_BOT_TOKEN": "1:bench",
+        "TELEGRAM_API_BASE": f"http://127.0.0.1:{args.tg_port}",
+        "API_BASE": f"http://127.0.0.1:{args.api_port}",
+        "ADMIN_EMAIL": ADMIN_EMAIL,
+        "SCHEDULER_ENABLED": "0",
+        "REPORT_RATE": str(args.report_rate),
+        "REPORT_CONCURRENCY": str(args.report_concurrency),
+    })
+    if args.edit_interval is not None:  # EDIT_CHAT_INTERVAL бота: сколько правок шторма склеится
+        os.environ["EDIT_CHAT_INTERVAL"] = str(args.edit_interval)
+    os.environ.setdefault("LLM_PARALLEL", str(args.llm_slots))
+    # очередь по умолчанию вмещает весь всплеск; задайте LLM_QUEUE_MAX, чтобы мерить отказы
+    os.environ.setdefault("LLM_QUEUE_MAX", str(max(32, args.ideas)))
+
+
+# ---------- сценарии ----------
+async def idea_burst(client, fakes, args) -> Dict:
+    tg_ids = await seed_users("7000", args.ideas, 0)
+    nonce = random.getrandbits(32)  # без попаданий в кэш роадмапов от прошлых прогонов
+    latencies, rejected, failed = [], 0, 0
+    stubs_before = _counter("llm_generations_total", source="stub_error")
+    parse_before = {k: _counter("llm_parse_total", result=k) for k in PARSE_RESULTS}
+
+    async def one(i: int, tg_id: str):
+        nonlocal rejected, failed
+        t0 = time.perf_counter()
+        r = await client.post("/projects/idea/jobs", json={"tg_id": tg_id, "idea": f"Сервис №{i} ({nonce}) для заметок"})
+        if r.status_code == 429:
+            rejected += 1
+            return
+        r.raise_for_status()
+        job_id = r.json()["job_id"]
+        while True:
+            await asyncio.sleep(args.poll_interval)
+            job = (await client.get(f"/projects/idea/jobs/{job_id}")).json()
+            if job["status"] in ("done", "error"):
+                break
+        if job["status"] == "error":
+            failed += 1
+        else:
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i, t) for i, t in enumerate(tg_ids)))
+    elapsed = time.perf_counter() - t0
+    llm = fakes["llm"].stats
+    return {
+        "ideas": args.ideas, "done": len(latencies), "rejected": rejected, "failed": failed,
+        "seconds": round(elapsed, 2), "ideas_per_s": round(len(latencies) / elapsed, 2),
+        "stub_fallbacks": int(_counter("llm_generations_total", source="stub_error") - stubs_before),
+        "llm_requests": llm["requests"], "llm_max_active": llm["max_active"],
+        "parse": {k: int(_counter("llm_parse_total", result=k) - v) for k, v in parse_before.items()},
+        **(summary(latencies) if latencies else {}),
+    }
+
+
+async def navigation_storm(client, fakes, args) -> Dict:
+    try:
+        sys.path.insert(0, os.path.abspath(BOT_DIR))
+        import bot as botmod
+        from aiogram.types import Update
+    except ImportError as e:
+        return {"skipped": f"bot недоступен: {e}"}
+
+    tg_ids = await seed_users("9000", args.chats, args.nav_projects)
+    trees = {}
+    for tg_id in tg_ids:
+        projects = (await client.get(f"/users/{tg_id}/projects")).json()["projects"]
+        trees[int(tg_id)] = [(p["id"], [t["id"] for t in p["tasks"]]) for p in projects]
+
+    tg = fakes["tg"]
+    before = dict(tg.calls)
+    update_id, samples = 0, {}
+
+    def callback(chat_id: int, data: str) -> Update:
+        nonlocal update_id
+        update_id += 1
+        return Update.model_validate({"update_id": update_id, "callback_query": {
+            "id": str(update_id), "chat_instance": "bench", "data": data,
+            "from": {"id": chat_id, "is_bot": False, "first_name": "nav"},
+            "message": {"message_id": 1, "date": int(time.time()), "text": "Выбери проект:",
+                        "chat": {"id": chat_id, "type": "private"},
+                        "from": {"id": 1, "is_bot": True, "first_name": "bench"}},
+        }}, context={"bot": botmod.bot})
+
+    async def chat(chat_id: int):
+        rnd = random.Random(chat_id)
+        for _ in range(args.rounds):
+            pid, task_ids = rnd.choice(trees[chat_id])
+            tid = rnd.choice(task_ids)
+            status = rnd.choice(("pending", "in_progress", "done"))
+            for step, data in (("projects", "upd:pg:0"), ("project", f"upd:p:{pid}"), ("task", f"upd:t:{pid}:{tid}"),
+                               ("status", f"upd:s:{status}:{tid}:{pid}"), ("back", f"upd:back:tasks:{pid}")):
+                t0 = time.perf_counter()
+                await botmod.dp.feed_update(botmod.bot, callback(chat_id, data))
+                samples.setdefault(step, []).append((time.perf_counter() - t0) * 1000)
+
+    await botmod.dp.emit_startup(bot=botmod.bot, dispatcher=botmod.dp)
+    try:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(chat(c) for c in trees))
+        elapsed = time.perf_counter() - t0
+    finally:
+        await botmod.dp.emit_shutdown(bot=botmod.bot, dispatcher=botmod.dp)
+        await botmod.bot.session.close()
+
+    callbacks = sum(len(v) for v in samples.values())
+    calls = {m: n - before.get(m, 0) for m, n in tg.calls.items() if n - before.get(m, 0)}
+    return {
+        "chats": args.chats, "callbacks": callbacks, "seconds": round(elapsed, 2),
+        "callbacks_per_s": round(callbacks / elapsed, 1), "telegram_calls": calls,
+        **summary(sum(samples.values(), [])),
+        "steps": {step: summary(v) for step, v in samples.items()},
+    }
+
+
+async def daily_report(client, fakes, args) -> Dict:
+    from app import progress, scheduler
+    from app.db import SessionLocal
+
+    t0 = time.perf_counter()
+    await seed_users("8", args.report_users, 1)
+    async with SessionLocal() as db:
+        await progress.rebuild(db)
+    seed_s = time.perf_counter() - t0
+
+    tg = fakes["tg"]
+    sent_before, rejected_before = tg.calls["sendMessage"], tg.rejected
+    t0 = time.perf_counter()
+    await scheduler.send_daily_reports()
+    elapsed = time.perf_counter() - t0
+    sent = tg.calls["sendMessage"] - sent_before
+    return {
+        "users": args.report_users, "sent": sent, "seed_s": round(seed_s, 2), "seconds": round(elapsed, 2),
+        "messages_per_s": round(sent / elapsed, 1), "rate_limit": args.report_rate,
+        "telegram_429": tg.rejected - rejected_before,
+    }
+
+
+async def admin_export(client, fakes, args) -> Dict:
+    from app.auth import create_admin_token
+
+    t0 = time.perf_counter()
+    await seed_users("6000", args.export_users, args.export_projects)
+    seed_s = time.perf_counter() - t0
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    headers = {"Authorization": f"Bearer {create_admin_token(ADMIN_EMAIL)}"}
+    lines, size, first_byte = 0, 0, None
+    t0 = time.perf_counter()
+    async with client.stream("GET", "/admin/users/export", params={"format": "ndjson"}, headers=headers) as r:
+        r.raise_for_status()
+        async for chunk in r.aiter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - t0
+            size += len(chunk)
+            lines += chunk.count(b"\n")
+    elapsed = time.perf_counter() - t0
+    return {
+        "users": lines, "mb": round(size / 2 ** 20, 2), "seed_s": round(seed_s, 2),
+        "seconds": round(elapsed, 2), "users_per_s": round(lines / elapsed, 1),
+        "first_byte_ms": round((first_byte or 0) * 1000, 1),
+        # ru_maxrss — пик процесса в КБ (Linux): рост пика за время выгрузки
+        "peak_rss_growth_mb": round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024, 1),
+    }
+
+
+# ---------- запуск ----------
+def _commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(base: Dict, new: Dict) -> Dict:
+    """{сценарий: {поле: [было, стало, Δ%]}} по общим числовым полям верхнего уровня."""
+    out = {}
+    for name, result in new["scenarios"].items():
+        old = base.get("scenarios", {}).get(name) or {}
+        diff = {}
+        for key, value in result.items():
+            prev = old.get(key)
+            if isinstance(value, (int, float)) and isinstance(prev, (int, float)) and not isinstance(value, bool):
+                diff[key] = [prev, value, round((value - prev) / prev * 100, 1) if prev else None]
+        out[name] = diff
+    return out
+
+
+async def run(args) -> Dict:
+    import httpx
+    from bench.fakes import FakeLLM, FakeTelegram, serve
+    from app.db import engine
+    from app.main import app
+
+    await reset_db()
+    fakes = {"llm": FakeLLM(args.llm_ttft, args.llm_tps, args.llm_slots, args.llm_faults), "tg": FakeTelegram(args.tg_limit)}
+    results = {}
+    async with serve(fakes["llm"].app, args.llm_port), serve(fakes["tg"].app, args.tg_port), \
+            serve(app, args.api_port, lifespan="on") as api:
+        async with httpx.AsyncClient(base_url=api, timeout=60,
+                                     limits=httpx.Limits(max_connections=200, max_keepalive_connections=200)) as client:
+            for name in args.scenarios:
+                result = await globals()[name](client, fakes, args)
+                results[name] = result
+                print(json.dumps({"bench": name, **result}, ensure_ascii=False), flush=True)
+    return {
+        "bench": "suite", "commit": _commit(), "database": engine.dialect.name,
+        "started_at": int(time.time()), "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "scenarios": results,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--quick", action="store_true", help="размеры в ~100 раз меньше, для проверки, что всё работает")
+    ap.add_argument("--out", help="записать результаты в JSON-файл")
+    ap.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    # фейки
+    ap.add_argument("--llm-ttft", type=float, default=0.3, help="prefill, с")
+    ap.add_argument("--llm-tps", type=float, default=50, help="токенов/с на слот")
+    ap.add_argument("--llm-slots", type=int, default=4)
+    ap.add_argument("--llm-faults", type=float, default=0.0, help="доля ответов с мусором вокруг JSON или обрывом")
+    ap.add_argument("--tg-limit", type=float, default=0, help="вызовов/с до 429 (0 — без лимита)")
+    ap.add_argument("--llm-port", type=int, default=18080)
+    ap.add_argument("--tg-port", type=int, default=18081)
+    ap.add_argument("--api-port", type=int, default=18000)
+    # размеры
+    ap.add_argument("--ideas", type=int, default=40)
+    ap.add_argument("--poll-interval", type=float, default=0.5)
+    ap.add_argument("--chats", type=int, default=200)
+    ap.add_argument("--rounds", type=int, default=2)
+    ap.add_argument("--nav-projects", type=int, default=5)
+    ap.add_argument("--edit-interval", type=float, help="EDIT_CHAT_INTERVAL бота (по умолчанию — из окружения)")
+    ap.add_argument("--report-users", type=int, default=100_000)
+    ap.add_argument("--report-rate", type=float, default=2000, help="REPORT_RATE на время прогона")
+    ap.add_argument("--report-concurrency", type=int, default=20)
+    ap.add_argument("--export-users", type=int, default=20_000)
+    ap.add_argument("--export-projects", type=int, default=3)
+    args = ap.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        ap.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+    if args.quick:
+        args.ideas, args.chats, args.rounds = min(args.ideas, 8), min(args.chats, 10), 1
+        args.report_users, args.export_users = min(args.report_users, 1000), min(args.export_users, 200)
+
+    configure(args)
+    report = asyncio.run(run(args))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        print(json.dumps({"bench": "compare", "base": base.get("commit"), "head": report["commit"],
+                          "scenarios": compare(base, report)}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
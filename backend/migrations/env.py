@@ -0,0 +1,42 @@
+import asyncio
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import text
+from app.db import Base, engine
+from app import models  # noqa: F401 — регистрирует таблицы в Base.metadata
+
+if context.config.config_file_name:
+    fileConfig(context.config.config_file_name)
+
+target_metadata = Base.metadata
+
+def run_offline():
+    context.configure(url=str(engine.url), target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def _run(connection):
+    # несколько реплик стартуют одновременно — миграции применяет одна, остальные ждут.
+    # Блокировка сессионная: CONCURRENTLY-индексы идут вне транзакции
+    locking = connection.dialect.name == "postgresql"
+    if locking:
+        connection.execute(text("SELECT pg_advisory_lock(7234001)"))
+        connection.commit()
+    context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=connection.dialect.name == "sqlite")
+    try:
+        with context.begin_transaction():
+            context.run_migrations()
+    finally:
+        if locking:
+            connection.execute(text("SELECT pg_advisory_unlock(7234001)"))
+            connection.commit()
+
+async def run_online():
+    async with engine.connect() as conn:
+        await conn.run_sync(_run)
+    await engine.dispose()
+
+if context.is_offline_mode():
+    run_offline()
+else:
+    asyncio.run(run_online())
@@ -0,0 +1,92 @@
+"""Схема на момент перехода на Alembic.
+
+Базы, созданные раньше через create_all, уже содержат эти таблицы —
+существующие пропускаем, так что upgrade head безопасен и для них.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+task_status = sa.Enum("pending", "in_progress", "done", name="taskstatus")
+
+def _counters():
+    return [sa.Column(c, sa.Integer(), nullable=False) for c in ("total", "pending", "in_progress", "done")]
+
+TABLES = {
+    "users": lambda: op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("tg_id", sa.String(64), nullable=False),
+        sa.Column("name", sa.String(120), nullable=False),
+        sa.Column("email", sa.String(255), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    ),
+    "projects": lambda: op.create_table(
+        "projects",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("title", sa.String(255), nullable=False),
+        sa.Column("description", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    ),
+    "tasks": lambda: op.create_table(
+        "tasks",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("project_id", sa.Integer(), sa.ForeignKey("projects.id"), nullable=False),
+        sa.Column("title", sa.String(255), nullable=False),
+        sa.Column("order", sa.Integer(), nullable=False),
+        sa.Column("status", task_status, nullable=False),
+    ),
+    "project_stats": lambda: op.create_table(
+        "project_stats",
+        sa.Column("project_id", sa.Integer(), sa.ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        *_counters(),
+    ),
+    "user_stats": lambda: op.create_table(
+        "user_stats",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        *_counters(),
+    ),
+    "job_state": lambda: op.create_table(
+        "job_state",
+        sa.Column("name", sa.String(64), primary_key=True),
+        sa.Column("next_run_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("locked_by", sa.String(128), nullable=True),
+        sa.Column("locked_until", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("cursor", sa.Integer(), nullable=False),
+        sa.Column("last_finished_at", sa.DateTime(timezone=True), nullable=True),
+    ),
+}
+
+INDEXES = [
+    ("ix_users_tg_id", "users", ["tg_id"], True),
+    ("ix_project_stats_user_id", "project_stats", ["user_id"], False),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = set(inspector.get_table_names())
+    for name, create in TABLES.items():
+        if name not in existing:
+            create()
+            existing.add(name)
+    for name, table, columns, unique in INDEXES:
+        if name not in {i["name"] for i in sa.inspect(op.get_bind()).get_indexes(table)}:
+            op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for name in reversed(list(TABLES)):
+        op.drop_table(name)
+    task_status.drop(op.get_bind(), checkfirst=True)
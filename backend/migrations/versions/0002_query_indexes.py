@@ -0,0 +1,34 @@
+"""Индексы под горячие запросы: проекты пользователя, задачи проекта, счётчики по статусам.
+
+На Postgres индексы строятся CONCURRENTLY — без блокировки записи в tasks.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_projects_user_id", "projects", ["user_id"]),
+    ("ix_tasks_project_status", "tasks", ["project_id", "status"]),
+    ("ix_tasks_project_order", "tasks", ["project_id", "order"]),
+]
+
+
+def upgrade():
+    concurrently = op.get_bind().dialect.name == "postgresql"
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=concurrently)
+
+
+def downgrade():
+    concurrently = op.get_bind().dialect.name == "postgresql"
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=concurrently)
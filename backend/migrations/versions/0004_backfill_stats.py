@@ -0,0 +1,47 @@
+"""Заполнить project_stats / user_stats по уже существующим задачам.
+
+0001 создаёт таблицы счётчиков пустыми, а хуки app.progress только прибавляют
+дельты — без пересчёта старые проекты так и остались бы с нулями. Те же
+GROUP BY, что в app.progress._project_rows / _user_rows (то есть rebuild);
+сверка — python -m app.progress check.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+COUNTERS = """
+    COUNT(t.id),
+    COALESCE(SUM(CASE WHEN t.status = 'pending' THEN 1 ELSE 0 END), 0),
+    COALESCE(SUM(CASE WHEN t.status = 'in_progress' THEN 1 ELSE 0 END), 0),
+    COALESCE(SUM(CASE WHEN t.status = 'done' THEN 1 ELSE 0 END), 0)
+"""
+
+
+def upgrade():
+    op.execute("DELETE FROM project_stats")
+    op.execute("DELETE FROM user_stats")
+    op.execute(f"""
+        INSERT INTO project_stats (project_id, user_id, total, pending, in_progress, done)
+        SELECT p.id, p.user_id, {COUNTERS}
+        FROM projects p LEFT JOIN tasks t ON t.project_id = p.id
+        GROUP BY p.id, p.user_id
+    """)
+    op.execute(f"""
+        INSERT INTO user_stats (user_id, total, pending, in_progress, done)
+        SELECT u.id, {COUNTERS}
+        FROM users u
+        LEFT JOIN projects p ON p.user_id = u.id
+        LEFT JOIN tasks t ON t.project_id = p.id
+        GROUP BY u.id
+    """)
+
+
+def downgrade():
+    pass  # счётчики — производные данные, схема не менялась
@@ -1,9 +1,12 @@
 # bot/bot.py
-import os, re, html, logging, contextlib, math, asyncio, random
+import os, re, json, html, time, logging, contextlib, math, asyncio
+from collections import OrderedDict
 from typing import Optional, List, Dict
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command, StateFilter
 from aiogram.types import (
     Message, CallbackQuery,
@@ -14,29 +17,138 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.storage.redis import RedisStorage
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.enums import ChatAction
 
 import httpx
+import redis.asyncio as aioredis
+from prometheus_client import start_http_server
+
+from edits import EditScheduler
+from metrics import HTTP_HOOKS, HandlerMetrics, PROJECTS_CACHE, api_error
 
 logging.basicConfig(level=logging.INFO)
 
 # ---------- ENV ----------
 API_BASE = os.getenv("API_BASE") or os.getenv("NEXT_PUBLIC_API_BASE_URL", "http://backend:8000")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE")  # свой Bot API server или фейк для нагрузочных тестов
 REDIS_URL = os.getenv("REDIS_URL")
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "300"))
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "50"))
+API_HTTP2 = os.getenv("API_HTTP2", "0") == "1"  # нужен пакет h2 и HTTP/2 на стороне API (Caddy)
+PROJECTS_FRESH_TTL = float(os.getenv("PROJECTS_FRESH_TTL", "30"))
+PROJECTS_CACHE_TTL = int(os.getenv("PROJECTS_CACHE_TTL", "3600"))
+PROJECTS_CACHE_SIZE = int(os.getenv("PROJECTS_CACHE_SIZE", "10000"))
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "0"))  # 0 — без /metrics
 
 # ---------- BOT / DP ----------
 bot = Bot(
     token=TELEGRAM_BOT_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE)) if TELEGRAM_API_BASE else None,
     default=DefaultBotProperties(parse_mode="HTML"),
 )
 storage = RedisStorage.from_url(REDIS_URL) if REDIS_URL else MemoryStorage()
+redis_client = aioredis.from_url(REDIS_URL) if REDIS_URL else None
 dp = Dispatcher(storage=storage)
+dp.message.middleware(HandlerMetrics())
+dp.callback_query.middleware(HandlerMetrics())
+# все правки «живых» сообщений идут через общий планировщик (склейка + лимиты)
+edits = EditScheduler(bot)
+idea_jobs: Dict[int, asyncio.Task] = {}  # chat_id → опрос генерации идеи
+
+def edit_message(msg: Message, text: str, reply_markup=None) -> asyncio.Future:
+    """Правка через общий планировщик. В колбэках не ждём: сначала cb.answer(), правка уйдёт в свой слот."""
+    return edits.edit(msg.chat.id, msg.message_id, text, reply_markup=reply_markup)
 
 # ---------- HTTP ----------
-def client() -> httpx.AsyncClient:
-    # читаем до 60с — локальная модель может думать подольше
-    return httpx.AsyncClient(base_url=API_BASE, timeout=httpx.Timeout(60.0, connect=5.0))
+# один пул соединений на весь процесс: открывается на старте, закрывается на остановке
+http: Optional[httpx.AsyncClient] = None
+
+@dp.startup()
+async def open_http():
+    global http
+    if BOT_METRICS_PORT:
+        start_http_server(BOT_METRICS_PORT)
+    http = httpx.AsyncClient(
+        base_url=API_BASE,
+        # генерация идёт фоновой задачей на бэкенде, сами запросы короткие
+        timeout=httpx.Timeout(15.0, connect=5.0),
+        limits=httpx.Limits(max_connections=API_MAX_CONNECTIONS, max_keepalive_connections=API_MAX_CONNECTIONS),
+        http2=API_HTTP2,
+        event_hooks=HTTP_HOOKS,
+    )
+
+@dp.shutdown()
+async def close_http():
+    jobs = list(idea_jobs.values())
+    for task in jobs:
+        task.cancel()
+    await asyncio.gather(*jobs, return_exceptions=True)
+    if http:
+        await http.aclose()
+    if redis_client:
+        await redis_client.aclose()
+    await edits.flush(5)  # финальные «✅ Готово» и ответы на колбэки не теряем
+    await edits.aclose()
+
+@contextlib.asynccontextmanager
+async def client():
+    # общий клиент не закрываем — обработчики просто берут его на время запроса
+    try:
+        yield http
+    except httpx.TransportError as e:
+        api_error(e.request)
+        raise
+
+# ---------- Проекты: кэш дерева на чат ----------
+# Свежую копию (PROJECTS_FRESH_TTL) отдаём без запроса; дальше — условный GET
+# с сохранённым ETag, на 304 бэкенд не шлёт тело. PATCH из бота сбрасывает кэш чата.
+_projects: "OrderedDict[str, Dict]" = OrderedDict()  # без Redis: tg_id → запись
+
+async def _cache_get(key: str) -> Optional[Dict]:
+    if redis_client:
+        with contextlib.suppress(Exception):
+            raw = await redis_client.get(f"bot:projects:{key}")
+            return json.loads(raw) if raw else None
+        return None
+    return _projects.get(key)
+
+async def _cache_set(key: str, entry: Dict):
+    if redis_client:
+        with contextlib.suppress(Exception):
+            await redis_client.setex(f"bot:projects:{key}", PROJECTS_CACHE_TTL, json.dumps(entry, ensure_ascii=False))
+        return
+    _projects[key] = entry
+    _projects.move_to_end(key)
+    while len(_projects) > PROJECTS_CACHE_SIZE:
+        _projects.popitem(last=False)
+
+async def invalidate_projects(tg_id):
+    key = str(tg_id)
+    if redis_client:
+        with contextlib.suppress(Exception):
+            await redis_client.delete(f"bot:projects:{key}")
+        return
+    _projects.pop(key, None)
+
+async def fetch_projects(cl: httpx.AsyncClient, tg_id) -> Dict:
+    """Проекты пользователя: из кэша чата, если свежие, иначе GET с If-None-Match."""
+    key = str(tg_id)
+    cached = await _cache_get(key)
+    if cached and cached["fresh_until"] > time.time():
+        PROJECTS_CACHE.labels("fresh").inc()
+        return cached["data"]
+    r = await cl.get(f"/users/{key}/projects", headers={"If-None-Match": cached["etag"]} if cached else None)
+    if r.status_code == 304 and cached:
+        PROJECTS_CACHE.labels("not_modified").inc()
+        data = cached["data"]
+    else:
+        PROJECTS_CACHE.labels("miss").inc()
+        r.raise_for_status()
+        data = r.json()
+    if etag := r.headers.get("etag"):
+        await _cache_set(key, {"etag": etag, "data": data, "fresh_until": time.time() + PROJECTS_FRESH_TTL})
+    return data
 
 # ---------- Helpers ----------
 E = html.escape
@@ -62,21 +174,19 @@ def progress_bar(percent: int, width: int = 12) -> str:
     filled = int(round(percent / 100 * width))
     return f"[{'█'*filled}{'░'*(width-filled)}] {percent}%"
 
-async def run_progress(chat_id: int, msg: Message) -> None:
-    """
-    Мягкая анимация прогресса, до 95% (чтобы был зазор на финиш).
-    Останавливается через cancel() из вызывающего кода.
-    """
-    p = 0
-    try:
-        while True:
-            p = min(95, p + random.randint(1, 3))
-            await bot.send_chat_action(chat_id, ChatAction.TYPING)
-            await msg.edit_text(f"⚙️ Генерирую план…\n<code>{progress_bar(p)}</code>")
-            await asyncio.sleep(0.4)
-    except asyncio.CancelledError:
-        # тихо выходим
-        raise
+EXPECTED_TASKS = 6
+
+def render_partial(partial: Dict) -> str:
+    tasks = partial.get("tasks") or []
+    p = min(95, round(len(tasks) / EXPECTED_TASKS * 95))
+    if partial.get("queued") and not tasks and not partial.get("description"):
+        return f"⏳ В очереди на генерацию: {partial['queued']}…\n<code>{progress_bar(0)}</code>"
+    parts = [f"⚙️ Генерирую план…\n<code>{progress_bar(p)}</code>"]
+    if partial.get("description"):
+        parts.append(f"<b>Описание</b>:\n{E(partial['description'])}")
+    if tasks:
+        parts.append("<b>Roadmap</b>:\n" + "\n".join(f"{i+1}. {E(t)}" for i, t in enumerate(tasks)))
+    return "\n\n".join(parts)
 
 # ---------- FSM ----------
 class Reg(StatesGroup):
@@ -180,36 +290,76 @@ async def idea_text(m: Message, state: FSMContext):
     text = norm(m.text)
     if len(text) < 8:
         return await m.answer("Идея слишком короткая. Добавь деталей и пришли снова.")
+    if (running := idea_jobs.get(m.chat.id)) and not running.done():
+        return await m.answer("Предыдущая идея ещё генерируется — дождись плана и пришли следующую.")
 
-    # стартовое сообщение + анимация прогресса
-    progress_msg = await m.answer(f"⚙️ Генерирую план…\n<code>{progress_bar(0)}</code>")
-    progress_task = asyncio.create_task(run_progress(m.chat.id, progress_msg))
+    # стартовое сообщение + частичные результаты фоновой генерации
+    first = render_partial({"description": None, "tasks": []})
+    progress_msg = await m.answer(first)
+    edits.remember(m.chat.id, progress_msg.message_id, first)
+    edits.action(m.chat.id)
 
     try:
         async with client() as cl:
-            r = await cl.post("/projects/idea", json={"tg_id": str(m.chat.id), "idea": text})
+            r = await cl.post("/projects/idea/jobs", json={"tg_id": str(m.chat.id), "idea": text})
+            if r.status_code == 429:
+                raise RuntimeError("сейчас слишком много генераций, попробуй через минуту")
             r.raise_for_status()
-            data = r.json()
+            job_id = r.json()["job_id"]
     except Exception as e:
-        progress_task.cancel()
-        with contextlib.suppress(asyncio.CancelledError):
-            await progress_task
         await state.clear()
-        return await progress_msg.edit_text(
-            f"❌ Не вышло сгенерировать план:\n<code>{E(str(e))}</code>",
-            reply_markup=None
-        )
+        await edit_message(progress_msg, f"❌ Не вышло сгенерировать план:\n<code>{E(str(e))}</code>")
+        return edits.forget(m.chat.id, progress_msg.message_id)
+
+    # генерация идёт минутами: опрос — отдельной задачей, чтобы следующие апдейты чата
+    # (/cancel, навигация) не ждали её в очереди чата (webhook-воркер обрабатывает чат по порядку)
+    await state.clear()
+    task = asyncio.create_task(follow_idea_job(m, progress_msg, job_id))
+    idea_jobs[m.chat.id] = task
+    task.add_done_callback(lambda t: idea_jobs.pop(m.chat.id, None) if idea_jobs.get(m.chat.id) is t else None)
 
-    # останавливаем анимацию, добиваем до 100%, показываем результат
-    progress_task.cancel()
-    with contextlib.suppress(asyncio.CancelledError):
-        await progress_task
-    await progress_msg.edit_text(f"✅ Готово!\n<code>{progress_bar(100)}</code>")
+async def follow_idea_job(m: Message, progress_msg: Message, job_id: str):
+    partial: Dict = {"description": None, "tasks": []}
+    try:
+        async with client() as cl:
+            deadline = time.monotonic() + JOB_MAX_WAIT
+            while True:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                r = await cl.get(f"/projects/idea/jobs/{job_id}")
+                r.raise_for_status()
+                job = r.json()
+                partial.update(
+                    queued=job.get("position") if job["status"] == "queued" else None,
+                    description=job.get("description"),
+                    tasks=job.get("tasks") or [],
+                )
+                # новый текст заменит ещё не отправленный; «печатает…» — пока нечего править
+                edit_message(progress_msg, render_partial(partial))
+                edits.action(m.chat.id)
+                if job["status"] == "done":
+                    data = job
+                    await invalidate_projects(m.chat.id)
+                    break
+                if job["status"] == "error":
+                    raise RuntimeError(job.get("error") or "генерация не удалась")
+                if time.monotonic() > deadline:
+                    raise RuntimeError("генерация заняла слишком много времени")
+    except asyncio.CancelledError:
+        # бот останавливается; генерация на бэкенде доедет, проект появится в списке
+        edit_message(progress_msg, "⏸ Бот перезапускается — готовый план появится в «📋 Проекты».")
+        edits.forget(m.chat.id, progress_msg.message_id)
+        raise
+    except Exception as e:
+        await edit_message(progress_msg, f"❌ Не вышло сгенерировать план:\n<code>{E(str(e))}</code>")
+        return edits.forget(m.chat.id, progress_msg.message_id)
+
+    # финальная правка вытесняет недоотправленный прогресс
+    await edit_message(progress_msg, f"✅ Готово!\n<code>{progress_bar(100)}</code>")
+    edits.forget(m.chat.id, progress_msg.message_id)
 
     desc = E(data.get("description", ""))
     tasks = data.get("tasks", []) or []
     tasks_text = "\n".join(f"{i+1}. {E(str(t))}" for i, t in enumerate(tasks))
-    await state.clear()
     await m.answer(
         f"<b>Описание</b>:\n{desc}\n\n<b>Roadmap</b>:\n{tasks_text}",
         reply_markup=main_kb()
@@ -221,9 +371,7 @@ async def idea_text(m: Message, state: FSMContext):
 async def projects_cmd(m: Message):
     try:
         async with client() as cl:
-            r = await cl.get(f"/users/{m.chat.id}/projects")
-            r.raise_for_status()
-            res = r.json()
+            res = await fetch_projects(cl, m.chat.id)
     except Exception as e:
         return await m.answer(f"Не смог получить проекты: <code>{E(str(e))}</code>", reply_markup=main_kb())
 
@@ -293,9 +441,7 @@ def build_status_kb(task_id: int, project_id: int) -> InlineKeyboardBuilder:
 async def update_entry(m: Message):
     try:
         async with client() as cl:
-            r = await cl.get(f"/users/{m.chat.id}/projects")
-            r.raise_for_status()
-            data = r.json()
+            data = await fetch_projects(cl, m.chat.id)
     except Exception as e:
         return await m.answer(f"Не удалось получить проекты: <code>{E(str(e))}</code>", reply_markup=main_kb())
 
@@ -314,24 +460,21 @@ async def upd_projects_page(cb: CallbackQuery):
         return await cb.answer("Ошибка пагинации", show_alert=True)
 
     async with client() as cl:
-        r = await cl.get(f"/users/{cb.from_user.id}/projects")
-        r.raise_for_status()
-        data = r.json()
+        data = await fetch_projects(cl, cb.from_user.id)
 
     projects = data.get("projects") or []
     if not projects:
-        await cb.message.edit_text("Нет проектов. Нажми «🆕 Идея».", reply_markup=None)
-        return await cb.answer()
+        await cb.answer()
+        edit_message(cb.message, "Нет проектов. Нажми «🆕 Идея».", reply_markup=None)
+        return
 
     kb = build_projects_kb(projects, page=page)
-    await cb.message.edit_text("Выбери проект:", reply_markup=kb.as_markup())
     await cb.answer()
+    edit_message(cb.message, "Выбери проект:", reply_markup=kb.as_markup())
 
 @dp.callback_query(F.data == "upd:back:projects")
 async def upd_back_projects(cb: CallbackQuery):
-    return await upd_projects_page(
-        CallbackQuery.model_construct(**{**cb.model_dump(), "data": "upd:pg:0"})
-    )
+    return await upd_projects_page(cb.model_copy(update={"data": "upd:pg:0"}))
 
 @dp.callback_query(F.data.startswith("upd:p:"))
 async def upd_choose_project(cb: CallbackQuery):
@@ -342,9 +485,7 @@ async def upd_choose_project(cb: CallbackQuery):
 
     try:
         async with client() as cl:
-            r = await cl.get(f"/users/{cb.from_user.id}/projects")
-            r.raise_for_status()
-            data = r.json()
+            data = await fetch_projects(cl, cb.from_user.id)
     except Exception as e:
         return await cb.answer(f"Ошибка API: {E(str(e))}", show_alert=True)
 
@@ -358,8 +499,8 @@ async def upd_choose_project(cb: CallbackQuery):
         return await cb.answer("В проекте нет задач", show_alert=True)
 
     kb = build_tasks_kb(project_id, tasks)
-    await cb.message.edit_text(f"<b>{E(project.get('title','Проект'))}</b>\nВыбери задачу:", reply_markup=kb.as_markup())
     await cb.answer()
+    edit_message(cb.message, f"<b>{E(project.get('title','Проект'))}</b>\nВыбери задачу:", reply_markup=kb.as_markup())
 
 @dp.callback_query(F.data.startswith("upd:back:tasks:"))
 async def upd_back_tasks(cb: CallbackQuery):
@@ -368,8 +509,7 @@ async def upd_back_tasks(cb: CallbackQuery):
     except Exception:
         return await cb.answer("Ошибка возврата", show_alert=True)
 
-    cb.data = f"upd:p:{project_id}"
-    return await upd_choose_project(cb)
+    return await upd_choose_project(cb.model_copy(update={"data": f"upd:p:{project_id}"}))
 
 @dp.callback_query(F.data.startswith("upd:t:"))
 async def upd_choose_task(cb: CallbackQuery):
@@ -381,8 +521,8 @@ async def upd_choose_task(cb: CallbackQuery):
         return await cb.answer("Ошибка выбора задачи", show_alert=True)
 
     kb = build_status_kb(task_id, project_id)
-    await cb.message.edit_text("Выбери новый статус:", reply_markup=kb.as_markup())
     await cb.answer()
+    edit_message(cb.message, "Выбери новый статус:", reply_markup=kb.as_markup())
 
 @dp.callback_query(F.data.startswith("upd:s:"))
 async def upd_set_status(cb: CallbackQuery):
@@ -396,12 +536,15 @@ async def upd_set_status(cb: CallbackQuery):
 
     try:
         async with client() as cl:
-            await cl.patch(f"/tasks/{task_id}", params={"status": status})
+            r = await cl.patch(f"/tasks/{task_id}", params={"status": status})
+            r.raise_for_status()
     except Exception as e:
         return await cb.answer(f"Ошибка API: {E(str(e))}", show_alert=True)
+    finally:
+        await invalidate_projects(cb.from_user.id)
 
-    await cb.message.edit_text(f"Статус обновлён: <b>{E(status)}</b> ✅", reply_markup=None)
     await cb.answer("Обновлено")
+    edit_message(cb.message, f"Статус обновлён: <b>{E(status)}</b> ✅", reply_markup=None)
 
 # ---------- Отчёт ----------
 @dp.message(Command("report"))
@@ -0,0 +1,221 @@
+# bot/edits.py
+"""
+Общий планировщик правок сообщений.
+
+Обработчики не правят «живые» сообщения напрямую, а отдают последний текст
+планировщику: edits.edit(chat_id, message_id, text). Дальше:
+  • правки одного сообщения склеиваются — уходит только последняя версия;
+  • правка с тем же текстом и клавиатурой, что уже отправлены, не отправляется;
+  • на чат — не чаще EDIT_CHAT_INTERVAL, на процесс — не больше EDIT_GLOBAL_RATE/с;
+  • «печатает…» (edits.action) отправляется в тех же слотах, только когда
+    в чате нет ожидающей правки и индикатор уже погас;
+  • на 429 чат (или весь процесс — для глобального лимита) ставится на паузу
+    по retry_after, правка остаётся в очереди.
+`await edits.edit(...)` ждёт, пока уйдёт эта правка или более новая.
+"""
+import os, time, asyncio, logging, contextlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.enums import ChatAction
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from metrics import EDITS
+
+log = logging.getLogger(__name__)
+
+EDIT_CHAT_INTERVAL = float(os.getenv("EDIT_CHAT_INTERVAL", "1.5"))
+EDIT_GLOBAL_RATE = float(os.getenv("EDIT_GLOBAL_RATE", "20"))
+ACTION_TTL = 4.5  # индикатор «печатает…» живёт ~5с
+SENT_CACHE_SIZE = 10_000
+
+Key = Tuple[int, int]  # (chat_id, message_id)
+
+def _fingerprint(text: str, markup) -> object:
+    """С чем сравнивать новую правку: текст, а с клавиатурой — ещё и её JSON."""
+    return text if markup is None else (text, markup.model_dump_json(exclude_none=True))
+
+class _Edit:
+    __slots__ = ("text", "markup", "waiters")
+
+    def __init__(self, text: str, markup, waiters: List[asyncio.Future]):
+        self.text = text
+        self.markup = markup
+        self.waiters = waiters
+
+class EditScheduler:
+    def __init__(self, bot: Bot, chat_interval: float = EDIT_CHAT_INTERVAL, global_rate: float = EDIT_GLOBAL_RATE):
+        self.bot = bot
+        self.chat_interval = chat_interval
+        self.global_interval = 1.0 / global_rate
+        self._pending: "OrderedDict[Key, _Edit]" = OrderedDict()  # FIFO по первой постановке
+        self._actions: Dict[int, ChatAction] = {}
+        self._sent: "OrderedDict[Key, object]" = OrderedDict()  # _fingerprint последней отправленной версии
+        self._sending: Set[_Edit] = set()
+        self._action_until: Dict[int, float] = {}
+        self._chat_next: Dict[int, float] = {}
+        self._global_next = 0.0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # ---- API для обработчиков ----
+    def remember(self, chat_id: int, message_id: int, text: str):
+        """Текст, с которым сообщение уже отправлено (чтобы не править на него же)."""
+        self._set_sent((chat_id, message_id), text)
+
+    def edit(self, chat_id: int, message_id: int, text: str, reply_markup=None) -> asyncio.Future:
+        key = (chat_id, message_id)
+        fut = asyncio.get_running_loop().create_future()
+        prev = self._pending.get(key)
+        if self._sent.get(key) == _fingerprint(text, reply_markup):
+            # сообщение уже в этом виде: ожидающую правку отменяем, всех ждущих отпускаем
+            if prev:
+                del self._pending[key]
+            EDITS.labels("skipped").inc()
+            for w in (prev.waiters if prev else []) + [fut]:
+                if not w.done():
+                    w.set_result(True)
+            return fut
+        if prev:  # last-write-wins, место в очереди сохраняется
+            EDITS.labels("coalesced").inc()
+            prev.text, prev.markup = text, reply_markup
+            prev.waiters.append(fut)
+        else:
+            self._pending[key] = _Edit(text, reply_markup, [fut])
+        self._kick()
+        return fut
+
+    def action(self, chat_id: int, action: ChatAction = ChatAction.TYPING):
+        if self._action_until.get(chat_id, 0.0) <= time.monotonic():
+            self._actions[chat_id] = action
+            self._kick()
+
+    def forget(self, chat_id: int, message_id: int):
+        self._sent.pop((chat_id, message_id), None)
+        self._actions.pop(chat_id, None)
+
+    async def flush(self, timeout: float):
+        """Дождаться ожидающих и уходящих правок (перед остановкой), не дольше timeout."""
+        waiters = [w for e in (*self._pending.values(), *self._sending) for w in e.waiters if not w.done()]
+        if waiters:
+            await asyncio.wait(waiters, timeout=timeout)
+
+    async def aclose(self):
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+    # ---- цикл ----
+    def _kick(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wake.set()
+
+    def _set_sent(self, key: Key, sent: object):
+        self._sent[key] = sent
+        self._sent.move_to_end(key)
+        while len(self._sent) > SENT_CACHE_SIZE:
+            self._sent.popitem(last=False)
+
+    def _next_job(self, now: float):
+        """(когда, job): job — ('edit', key) или ('action', chat_id) для ближайшего доступного слота."""
+        best = None
+        for key in self._pending:
+            at = self._chat_next.get(key[0], 0.0)
+            if best is None or at < best[0]:
+                best = (at, ("edit", key))
+            if at <= now:
+                break
+        busy = {k[0] for k in self._pending}
+        for chat_id in self._actions:
+            if chat_id in busy:
+                continue
+            at = max(self._chat_next.get(chat_id, 0.0), self._action_until.get(chat_id, 0.0))
+            if best is None or at < best[0]:
+                best = (at, ("action", chat_id))
+        if best is None:
+            return None
+        return max(best[0], self._global_next), best[1]
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            now = time.monotonic()
+            job = self._next_job(now)
+            if job is None:
+                await self._wake.wait()
+                continue
+            at, (kind, target) = job
+            if at > now:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wake.wait(), at - now)
+                continue
+            now = time.monotonic()
+            self._global_next = now + self.global_interval
+            if len(self._chat_next) > SENT_CACHE_SIZE:
+                self._prune(now)
+            if kind == "edit":
+                edit = self._pending.pop(target)
+                self._sending.add(edit)
+                self._chat_next[target[0]] = now + self.chat_interval
+                asyncio.create_task(self._send_edit(target, edit))
+            else:
+                action = self._actions.pop(target)
+                self._chat_next[target] = now + self.chat_interval
+                self._action_until[target] = now + ACTION_TTL
+                asyncio.create_task(self._send_action(target, action))
+
+    async def _send_edit(self, key: Key, edit: _Edit):
+        try:
+            await self._deliver(key, edit)
+        finally:
+            self._sending.discard(edit)
+
+    async def _deliver(self, key: Key, edit: _Edit):
+        chat_id, message_id = key
+        ok = False
+        try:
+            await self.bot.edit_message_text(edit.text, chat_id=chat_id, message_id=message_id, reply_markup=edit.markup)
+            ok = True
+        except TelegramRetryAfter as e:
+            EDITS.labels("retry_after").inc()
+            self._pause(chat_id, e.retry_after)
+            if key not in self._pending:  # более новой правки нет — повторим эту
+                self._pending[key] = edit
+                self._kick()
+                return
+            self._pending[key].waiters[:0] = edit.waiters
+            return
+        except TelegramBadRequest as e:
+            # "message is not modified" и удалённые сообщения — правка больше не нужна
+            log.debug("edit %s: %s", key, e)
+        except Exception:
+            log.exception("edit %s failed", key)
+        EDITS.labels("sent" if ok else "failed").inc()
+        if ok:
+            self._set_sent(key, _fingerprint(edit.text, edit.markup))
+        for w in edit.waiters:
+            if not w.done():
+                w.set_result(ok)
+
+    async def _send_action(self, chat_id: int, action: ChatAction):
+        try:
+            await self.bot.send_chat_action(chat_id, action)
+        except TelegramRetryAfter as e:
+            self._pause(chat_id, e.retry_after)
+        except Exception as e:
+            log.debug("chat action %s: %s", chat_id, e)
+
+    def _prune(self, now: float):
+        for d in (self._chat_next, self._action_until):
+            for chat_id in [c for c, t in d.items() if t < now]:
+                del d[chat_id]
+
+    def _pause(self, chat_id: int, retry_after: float):
+        until = time.monotonic() + retry_after
+        self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), until)
+        # 429 без привязки к чату бывает и по глобальному лимиту — притормаживаем весь процесс
+        self._global_next = max(self._global_next, time.monotonic() + min(retry_after, 1.0))
+        self._kick()
@@ -0,0 +1,166 @@
+# bot/loadtest.py
+"""
+Нагрузочный прогон webhook-режима против фейкового Telegram Bot API.
+
+    python loadtest.py --chats 500 --per-chat 6 [--workers 4]
+    python loadtest.py --updates recorded.jsonl     # свои записанные апдейты
+
+Поднимает фейковый Bot API (отвечает на любые методы и записывает исходящие
+сообщения), запускает `webhook.py serve` и `webhook.py worker` с
+TELEGRAM_API_BASE на фейк, шлёт апдейты в webhook и ждёт ответы. Без --updates
+каждый чат проходит цикл /start → имя → /cancel: ответы зависят от FSM, так что
+перестановка апдейтов внутри чата видна как несовпадение. Нужен Redis (REDIS_URL).
+
+Результат — одна JSON-строка: пропускная способность, задержка апдейт → ответ
+(p50/p95), число чатов с нарушенным порядком.
+"""
+import os, sys, json, time, asyncio, argparse, contextlib, statistics, subprocess
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+from aiohttp import web
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:bench")
+from webhook import chat_id_of
+
+CYCLE = [("/start", "Привет!"), ("Иван", "Отлично."), ("/cancel", "Окей, отменил.")]
+
+class FakeTelegram:
+    def __init__(self):
+        self.sent: Dict[int, List[tuple]] = defaultdict(list)  # chat_id → [(время, текст)]
+        self.message_id = 0
+        self.calls = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.calls += 1
+        method = request.match_info["method"]
+        data = dict(await request.post()) if request.content_type != "application/json" else await request.json()
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}})
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(data["chat_id"])
+            self.sent[chat_id].append((time.monotonic(), data.get("text", "")))
+            self.message_id += 1
+            return web.json_response({"ok": True, "result": {
+                "message_id": self.message_id, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "text": data.get("text", ""),
+            }})
+        return web.json_response({"ok": True, "result": True})
+
+    async def start(self, port: int) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        return runner
+
+def synthetic_updates(chats: int, per_chat: int) -> List[Dict]:
+    updates, uid = [], 0
+    for i in range(per_chat):
+        for c in range(chats):
+            uid += 1
+            chat_id = 10_000 + c
+            updates.append({"update_id": uid, "message": {
+                "message_id": uid, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "load"},
+                "text": CYCLE[i % len(CYCLE)][0],
+            }})
+    return updates
+
+async def wait_ready(client: httpx.AsyncClient, url: str, attempts: int = 100):
+    for _ in range(attempts):
+        with contextlib.suppress(httpx.TransportError):
+            if (await client.get(url)).status_code == 200:
+                return
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} не поднялся")
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, int(round(len(ordered) * q)) - 1)] if ordered else 0.0
+
+async def run(args) -> int:
+    fake = FakeTelegram()
+    runner = await fake.start(args.tg_port)
+    env = {**os.environ, "TELEGRAM_API_BASE": f"http://127.0.0.1:{args.tg_port}",
+           "WEBHOOK_PORT": str(args.webhook_port), "BOT_WORKERS": str(args.workers), "WEBHOOK_URL": ""}
+    here = os.path.dirname(os.path.abspath(__file__))
+    procs = [] if args.no_spawn else [
+        subprocess.Popen([sys.executable, "webhook.py", "serve"], cwd=here, env=env),
+        subprocess.Popen([sys.executable, "webhook.py", "worker"], cwd=here, env=env),
+    ]
+    try:
+        if args.updates:
+            with open(args.updates) as f:
+                updates = [json.loads(line) for line in f if line.strip()]
+        else:
+            updates = synthetic_updates(args.chats, args.per_chat)
+        url = f"http://127.0.0.1:{args.webhook_port}/tg/webhook"
+
+        async with httpx.AsyncClient(timeout=10) as client:
+            await wait_ready(client, f"http://127.0.0.1:{args.webhook_port}/health")
+
+            sent_at: Dict[int, List[float]] = defaultdict(list)
+            slots = asyncio.Semaphore(args.concurrency)
+
+            # апдейты одного чата уходят по порядку, как от Telegram; чаты — параллельно
+            by_chat: Dict[int, List[Dict]] = defaultdict(list)
+            for u in updates:
+                by_chat[chat_id_of(u)].append(u)
+
+            async def replay(chat_id, chat_updates):
+                for u in chat_updates:
+                    async with slots:
+                        sent_at[chat_id].append(time.monotonic())
+                        (await client.post(url, json=u)).raise_for_status()
+
+            t0 = time.monotonic()
+            await asyncio.gather(*(replay(c, us) for c, us in by_chat.items()))
+            expected = len(updates)
+            deadline = time.monotonic() + args.timeout
+            while sum(len(v) for v in fake.sent.values()) < expected and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+            elapsed = time.monotonic() - t0
+
+        replies = sum(len(v) for v in fake.sent.values())
+        latencies, out_of_order = [], 0
+        for chat_id, times in sent_at.items():
+            got = fake.sent.get(chat_id, [])
+            latencies += [(r[0] - s) * 1000 for s, r in zip(times, got)]
+            if not args.updates:
+                want = [CYCLE[i % len(CYCLE)][1] for i in range(len(times))]
+                if len(got) != len(want) or not all(t.startswith(w) for (_, t), w in zip(got, want)):
+                    out_of_order += 1
+        print(json.dumps({
+            "bench": "bot_webhook", "workers": args.workers, "updates": expected, "replies": replies,
+            "seconds": round(elapsed, 2), "updates_per_s": round(replies / elapsed, 1) if elapsed else 0,
+            "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+            "p95_ms": round(percentile(latencies, 0.95), 1) if latencies else None,
+            "chats_out_of_order": out_of_order,
+        }))
+        return 0 if replies == expected and not out_of_order else 1
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+        await runner.cleanup()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chats", type=int, default=200)
+    ap.add_argument("--per-chat", type=int, default=6)
+    ap.add_argument("--updates", help="JSONL с записанными апдейтами")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--concurrency", type=int, default=100, help="одновременных POST в webhook")
+    ap.add_argument("--tg-port", type=int, default=8090)
+    ap.add_argument("--webhook-port", type=int, default=8081)
+    ap.add_argument("--timeout", type=float, default=60)
+    ap.add_argument("--no-spawn", action="store_true", help="webhook и воркеры уже запущены")
+    sys.exit(asyncio.run(run(ap.parse_args())))
+
+if __name__ == "__main__":
+    main()
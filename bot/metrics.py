@@ -0,0 +1,59 @@
+# bot/metrics.py
+"""
+Метрики бота. Сервер /metrics поднимается на BOT_METRICS_PORT (0 — выключен);
+в webhook-режиме у каждого воркера свой порт: BOT_METRICS_PORT + индекс.
+"""
+import re, time
+from typing import Any, Awaitable, Callable, Dict
+
+import httpx
+from aiogram import BaseMiddleware
+from prometheus_client import Counter, Histogram
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_duration_seconds", "Время обработчика", ["handler"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в обработчиках", ["handler"])
+API_LATENCY = Histogram(
+    "bot_backend_request_duration_seconds", "Запросы бота к backend API", ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 15),
+)
+API_ERRORS = Counter("bot_backend_errors_total", "Запросы к backend API без ответа", ["method", "route"])
+PROJECTS_CACHE = Counter("bot_projects_cache_total", "Кэш дерева проектов", ["result"])  # fresh | not_modified | miss
+EDITS = Counter("bot_edits_total", "Правки сообщений", ["result"])  # sent | coalesced | skipped | retry_after | failed
+
+# /projects/idea/jobs/3f2a… и /tasks/42 → одна серия на маршрут
+_ID = re.compile(r"/(?:\d+|[0-9a-f]{8,}|[0-9a-f-]{36})(?=/|$)")
+
+def route_of(path: str) -> str:
+    return _ID.sub("/{id}", path)
+
+class HandlerMetrics(BaseMiddleware):
+    """Внутренний middleware: к этому моменту фильтры отработали и известен обработчик."""
+    async def __call__(self, handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]], event: Any, data: Dict[str, Any]) -> Any:
+        h = data.get("handler")
+        name = h.callback.__name__ if h else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+async def _on_request(request: httpx.Request):
+    request.extensions["started"] = time.perf_counter()
+
+async def _on_response(response: httpx.Response):
+    request = response.request
+    API_LATENCY.labels(request.method, route_of(request.url.path), str(response.status_code)).observe(
+        time.perf_counter() - request.extensions["started"]
+    )
+
+# event_hooks для httpx.AsyncClient; транспортные ошибки считает api_error
+HTTP_HOOKS = {"request": [_on_request], "response": [_on_response]}
+
+def api_error(request: httpx.Request):
+    API_ERRORS.labels(request.method, route_of(request.url.path)).inc()
@@ -0,0 +1,212 @@
+# bot/webhook.py
+"""
+Webhook-режим: приём апдейтов отдельно от обработки.
+
+    python webhook.py serve      # aiohttp: POST /tg/webhook → очередь шарда в Redis
+    python webhook.py worker     # BOT_WORKERS процессов, читают свои шарды
+
+Апдейт кладётся в Redis Stream bot:updates:<shard>, shard = chat_id % BOT_SHARDS.
+Каждый шард читает ровно один процесс: BOT_REPLICAS × BOT_WORKERS процессов
+делят шарды по индексу (BOT_REPLICA_INDEX задаёт номер реплики), и один
+XREADGROUP ждёт сразу по всем своим шардам. Внутри процесса апдейты одного
+чата идут цепочкой — порядок сохраняется, разные чаты обрабатываются
+параллельно. Слот BOT_WORKER_CONCURRENCY апдейт занимает, только дождавшись
+предыдущего апдейта своего чата: очередь одного занятого чата не держит слоты
+остальных. Прочитанных, но ещё не обработанных апдейтов на процесс не больше
+BOT_WORKER_BACKLOG — дальше XREADGROUP ждёт. FSM — общий RedisStorage, поэтому смена раскладки ничего не ломает.
+
+Апдейт подтверждается (XACK) после обработки. Имя потребителя постоянное
+(worker-<индекс>), поэтому после падения процесс сначала дочитывает свои
+неподтверждённые апдейты (at-least-once), а затем через XAUTOCLAIM забирает
+зависшие дольше BOT_CLAIM_IDLE апдейты своих шардов, оставшиеся за потребителями,
+которых после смены BOT_WORKERS/BOT_REPLICAS больше нет.
+"""
+import os, sys, json, signal, asyncio, logging, contextlib
+import multiprocessing as mp
+from typing import Dict, List
+
+import redis.asyncio as aioredis
+from aiohttp import web
+from aiogram.types import Update
+
+from bot import bot, dp, REDIS_URL
+
+log = logging.getLogger("webhook")
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный https://…/tg/webhook
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/tg/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8081"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "100"))
+BOT_SHARDS = int(os.getenv("BOT_SHARDS", "64"))
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "4"))
+BOT_REPLICAS = int(os.getenv("BOT_REPLICAS", "1"))
+BOT_REPLICA_INDEX = int(os.getenv("BOT_REPLICA_INDEX", "0"))
+BOT_WORKER_CONCURRENCY = int(os.getenv("BOT_WORKER_CONCURRENCY", "100"))
+BOT_WORKER_BACKLOG = int(os.getenv("BOT_WORKER_BACKLOG", str(BOT_WORKER_CONCURRENCY * 10)))
+BOT_STREAM_MAXLEN = int(os.getenv("BOT_STREAM_MAXLEN", "100000"))
+BOT_CLAIM_IDLE = float(os.getenv("BOT_CLAIM_IDLE", "60"))  # с: чужие неподтверждённые апдейты старше — забираем
+GROUP = "workers"
+
+def stream_key(shard: int) -> str:
+    return f"bot:updates:{shard}"
+
+def chat_id_of(update: Dict) -> int:
+    """chat.id апдейта (для callback — чат сообщения с кнопкой), иначе from.id."""
+    for kind, obj in update.items():
+        if not isinstance(obj, dict):
+            continue
+        if kind == "callback_query" and obj.get("message"):
+            return obj["message"]["chat"]["id"]
+        if "chat" in obj:
+            return obj["chat"]["id"]
+        if "from" in obj:
+            return obj["from"]["id"]
+    return 0
+
+# ---------- приём ----------
+async def receive(request: web.Request) -> web.Response:
+    if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+        return web.Response(status=401)
+    raw = await request.read()
+    try:
+        shard = chat_id_of(json.loads(raw)) % BOT_SHARDS
+    except (ValueError, KeyError, TypeError):
+        return web.Response(status=400)
+    await request.app["redis"].xadd(stream_key(shard), {"u": raw}, maxlen=BOT_STREAM_MAXLEN, approximate=True)
+    return web.Response()
+
+async def on_startup(app: web.Application):
+    app["redis"] = aioredis.from_url(REDIS_URL)
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        log.info("webhook set to %s", WEBHOOK_URL)
+
+async def on_cleanup(app: web.Application):
+    await app["redis"].aclose()
+    await bot.session.close()
+
+def serve():
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, receive)
+    app.router.add_get("/health", lambda _: web.json_response({"ok": True}))
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    web.run_app(app, host="0.0.0.0", port=WEBHOOK_PORT)
+
+# ---------- обработка ----------
+class ShardWorker:
+    def __init__(self, index: int, shards: List[int]):
+        self.consumer = f"worker-{index}"
+        self.streams = [stream_key(s) for s in shards]
+        self.r = aioredis.from_url(REDIS_URL)
+        self.slots = asyncio.Semaphore(BOT_WORKER_CONCURRENCY)  # апдейты в обработке
+        self.backlog = asyncio.Semaphore(BOT_WORKER_BACKLOG)  # прочитанные, включая ждущих свой чат
+        self.tails: Dict[int, asyncio.Task] = {}  # chat_id → последний апдейт чата в работе
+
+    async def handle(self, stream: bytes, msg_id: bytes, raw: bytes, chat_id: int, prev):
+        try:
+            if prev:
+                await asyncio.wait([prev])
+            async with self.slots:
+                update = Update.model_validate(json.loads(raw), context={"bot": bot})
+                await dp.feed_update(bot, update)
+        except Exception:
+            log.exception("update failed (%s, chat %s)", stream, chat_id)
+        finally:
+            await self.r.xack(stream, GROUP, msg_id)
+            self.backlog.release()
+            if self.tails.get(chat_id) is asyncio.current_task():
+                del self.tails[chat_id]
+
+    async def dispatch(self, batches):
+        for stream, messages in batches:
+            for msg_id, fields in messages:
+                raw = fields[b"u"]
+                chat_id = chat_id_of(json.loads(raw))
+                await self.backlog.acquire()
+                self.tails[chat_id] = asyncio.create_task(
+                    self.handle(stream, msg_id, raw, chat_id, self.tails.get(chat_id))
+                )
+
+    async def claim_orphans(self):
+        for stream in self.streams:
+            start = "0-0"
+            while True:
+                start, messages, *_ = await self.r.xautoclaim(
+                    stream, GROUP, self.consumer, int(BOT_CLAIM_IDLE * 1000), start_id=start, count=BOT_WORKER_CONCURRENCY,
+                )
+                # записи, вытесненные MAXLEN, приходят без полей — их только подтверждаем
+                gone = [msg_id for msg_id, fields in messages if not fields]
+                if gone:
+                    await self.r.xack(stream, GROUP, *gone)
+                claimed = [(msg_id, fields) for msg_id, fields in messages if fields]
+                if claimed:
+                    log.info("%s: claimed %d orphaned updates from %s", self.consumer, len(claimed), stream)
+                    await self.dispatch([(stream, claimed)])
+                if start in (b"0-0", "0-0"):
+                    break
+
+    async def consume(self):
+        for stream in self.streams:
+            with contextlib.suppress(aioredis.ResponseError):  # BUSYGROUP — группа уже есть
+                await self.r.xgroup_create(stream, GROUP, id="0", mkstream=True)
+        # сначала неподтверждённые апдейты этого потребителя (упали посреди обработки)
+        pending = await self.r.xreadgroup(GROUP, self.consumer, {s: "0" for s in self.streams})
+        await self.dispatch(pending)
+        await self.claim_orphans()
+        new = {s: ">" for s in self.streams}
+        while True:
+            batches = await self.r.xreadgroup(GROUP, self.consumer, new, count=BOT_WORKER_CONCURRENCY, block=5000)
+            await self.dispatch(batches or [])
+
+    async def run(self):
+        await dp.emit_startup(bot=bot, dispatcher=dp)
+        try:
+            await self.consume()
+        finally:
+            if self.tails:
+                await asyncio.wait(list(self.tails.values()), timeout=10)
+            await dp.emit_shutdown(bot=bot, dispatcher=dp)
+            await self.r.aclose()
+            await bot.session.close()
+
+def _worker_main(index: int, count: int):
+    logging.basicConfig(level=logging.INFO)
+    import bot as bot_module
+    if bot_module.BOT_METRICS_PORT:  # свой /metrics у каждого процесса
+        bot_module.BOT_METRICS_PORT += index
+    shards = [s for s in range(BOT_SHARDS) if s % count == index]
+    log.info("worker %s/%s: shards %s", index, count, shards)
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(ShardWorker(index, shards).run())
+
+def workers():
+    count = BOT_REPLICAS * BOT_WORKERS
+    if count > BOT_SHARDS:
+        sys.exit(f"BOT_SHARDS={BOT_SHARDS} < {count} worker processes")
+    ctx = mp.get_context("spawn")
+    procs = [
+        ctx.Process(target=_worker_main, args=(BOT_REPLICA_INDEX * BOT_WORKERS + i, count), daemon=True)
+        for i in range(BOT_WORKERS)
+    ]
+    for p in procs:
+        p.start()
+    signal.signal(signal.SIGTERM, lambda *_: [p.terminate() for p in procs])
+    for p in procs:
+        p.join()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "serve"
+    if cmd == "serve":
+        serve()
+    elif cmd == "worker":
+        workers()
+    else:
+        sys.exit("usage: python webhook.py [serve|worker]")
@@ -1,5 +1,5 @@
 'use client'
-import { useEffect, useMemo, useRef, useState } from 'react'
+import { useEffect, useRef, useState } from 'react'
 
 type Task = { id:number; title:string; order:number; status:'pending'|'in_progress'|'done' }
 type Project = { id:number; title:string; description:string; tasks:Task[] }
@@ -36,9 +36,14 @@ type ReviewState = {
   error?: string
 }
 
+const PAGE_SIZE = 50
+
 export default function AdminPage(){
   const [users, setUsers] = useState<User[]>([])
+  const [nextCursor, setNextCursor] = useState<number|null>(null)
+  const [loading, setLoading] = useState(false)
   const [query, setQuery] = useState('')
+  const [statusFilter, setStatusFilter] = useState<''|Task['status']>('')
   const [token, setToken] = useState<string>('')
   const [ready, setReady] = useState(false)  
 
@@ -56,22 +61,62 @@ export default function AdminPage(){
     setReady(true)
   }, [])
 
-  const fetchUsers = async () => {
+  const filterParams = () => {
+    const params = new URLSearchParams()
+    if (query.trim()) params.set('user', query.trim())
+    if (statusFilter) params.set('status', statusFilter)
+    return params
+  }
+
+  // страницы по cursor: reset — с начала (смена фильтров), иначе дозагрузка
+  const fetchUsers = async (reset: boolean) => {
     if (!token) return
-    const res = await fetch(`${API}/admin/users`, { headers: { Authorization: `Bearer ${token}` } })
-    if (res.ok) {
-      const data = await res.json()
-      setUsers(data.users)
+    const params = filterParams()
+    params.set('limit', String(PAGE_SIZE))
+    if (!reset && nextCursor) params.set('cursor', String(nextCursor))
+    setLoading(true)
+    try {
+      const res = await fetch(`${API}/admin/users?${params}`, { headers: { Authorization: `Bearer ${token}` } })
+      if (res.ok) {
+        const data = await res.json()
+        setUsers(prev => reset ? data.users : [...prev, ...data.users])
+        setNextCursor(data.next_cursor ?? null)
+      }
+    } finally {
+      setLoading(false)
     }
   }
-  useEffect(() => { if (ready) fetchUsers() }, [ready, token])
+  useEffect(() => {
+    if (!ready) return
+    const t = setTimeout(() => fetchUsers(true), 300)
+    return () => clearTimeout(t)
+  }, [ready, token, query, statusFilter])
 
   const setStatus = async (taskId:number, status:Task['status']) => {
-    await fetch(`${API}/admin/tasks/${taskId}?status=${status}`, {
+    const res = await fetch(`${API}/admin/tasks/${taskId}?status=${status}`, {
       method:'PATCH',
       headers: { Authorization: `Bearer ${token}` }
     })
-    fetchUsers()
+    if (!res.ok) return
+    // меняем задачу на месте, не перезапрашивая все загруженные страницы
+    setUsers(prev => prev.map(u => ({
+      ...u,
+      projects: u.projects.map(p => ({
+        ...p,
+        tasks: p.tasks.map(t => t.id === taskId ? { ...t, status } : t),
+      })),
+    })))
+  }
+
+  const exportUsers = async () => {
+    const res = await fetch(`${API}/admin/users/export?${filterParams()}`, { headers: { Authorization: `Bearer ${token}` } })
+    if (!res.ok) return
+    const url = URL.createObjectURL(await res.blob())
+    const a = document.createElement('a')
+    a.href = url
+    a.download = 'users.ndjson'
+    a.click()
+    URL.revokeObjectURL(url)
   }
 
   /* ===== AI Review с «живым» прогрессом ===== */
@@ -133,21 +178,8 @@ export default function AdminPage(){
     setReview(prev => ({ ...prev, [projectId]: { running: false, value: 0, comment: undefined, error: 'Отменено' } }))
   }
 
-  const filtered = useMemo(() => {
-    const q = query.trim().toLowerCase()
-    if (!q) return users
-    return users
-      .map(u => ({
-        ...u,
-        projects: u.projects.filter(p =>
-          p.title.toLowerCase().includes(q) ||
-          p.description.toLowerCase().includes(q) ||
-          u.name.toLowerCase().includes(q) ||
-          u.email.toLowerCase().includes(q)
-        )
-      }))
-      .filter(u => u.projects.length > 0)
-  }, [users, query])
+  // фильтрация — на сервере (user, status); здесь только загруженные страницы
+  const filtered = users
 
   if (!ready) return null
 
@@ -158,10 +190,26 @@ export default function AdminPage(){
         <div className="flex items-center gap-2">
           <input
             className="w-72 max-w-full rounded-xl border border-black/10 dark:border-white/10 bg-white/70 dark:bg-neutral-900 px-3 py-2 shadow-inner"
-            placeholder="Поиск: имя, email, проект…"
+            placeholder="Поиск: имя, email, tg_id, проект…"
             value={query}
             onChange={e=>setQuery(e.target.value)}
           />
+          <select
+            className="rounded-xl border border-black/10 dark:border-white/10 bg-white/70 dark:bg-neutral-900 px-3 py-2"
+            value={statusFilter}
+            onChange={e=>setStatusFilter(e.target.value as ''|Task['status'])}
+          >
+            <option value="">все статусы</option>
+            <option value="pending">pending</option>
+            <option value="in_progress">in_progress</option>
+            <option value="done">done</option>
+          </select>
+          <button
+            onClick={exportUsers}
+            className="rounded-xl border border-black/10 dark:border-white/10 px-3 py-2 text-sm hover:bg-black/5 dark:hover:bg-white/10 transition"
+          >
+            Экспорт
+          </button>
           <a
             href="/login"
             onClick={(e)=>{ e.preventDefault(); localStorage.removeItem('token'); location.href='/login' }}
@@ -277,7 +325,18 @@ export default function AdminPage(){
             </div>
           </section>
         ))}
-        {filtered.length === 0 && (
+        {nextCursor !== null && (
+          <div className="flex justify-center">
+            <button
+              onClick={()=>fetchUsers(false)}
+              disabled={loading}
+              className="rounded-xl border border-black/10 dark:border-white/10 px-4 py-2 text-sm hover:bg-black/5 dark:hover:bg-white/10 transition disabled:opacity-50"
+            >
+              {loading ? 'Загрузка…' : 'Загрузить ещё'}
+            </button>
+          </div>
+        )}
+        {!loading && filtered.length === 0 && (
           <div className="rounded-3xl border border-black/5 dark:border-white/10 bg-white/70 dark:bg-neutral-900/60 p-10 text-center">
             <div className="mx-auto h-10 w-10 rounded-2xl bg-gradient-to-tr from-sky-400 via-fuchsia-500 to-violet-600 mb-3" />
             <div className="font-medium">Ничего не найдено</div>